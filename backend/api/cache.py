@@ -0,0 +1,128 @@
+import hashlib
+import time
+from array import array
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+# имя набора: (модель, поле пользователя, поле связанного объекта)
+RELATIONS = {
+    'favorites': (Favorite, 'user_id', 'recipe_id'),
+    'shopping_cart': (ShoppingCart, 'user_id', 'recipe_id'),
+    'subscriptions': (Subscription, 'user_id', 'author_id'),
+}
+# списки, отсортированные по счетчику избранного: их порядок меняется
+# вместе с избранным, а не с самими рецептами
+POPULAR_LIST = 'list:ordering:popular'
+
+
+def relation_key(name, user_id):
+    return f'relations:{name}:{user_id}'
+
+
+def get_relation_ids(name, user_id):
+    key = relation_key(name, user_id)
+    packed = cache.get(key)
+    if packed is None:
+        model, user_field, related_field = RELATIONS[name]
+        packed = array('l', sorted(
+            # без сортировки из Meta.ordering id читаются только из индекса
+            model.objects.filter(
+                **{user_field: user_id}
+            ).order_by().values_list(related_field, flat=True)
+        )).tobytes()
+        cache.set(key, packed, settings.RELATION_CACHE_TIMEOUT)
+    ids = array('l')
+    ids.frombytes(packed)
+    return frozenset(ids)
+
+
+def invalidate_relation_ids(name, user_id):
+    cache.delete(relation_key(name, user_id))
+
+
+def user_relation_ids(request, name):
+    if not request or not request.user.is_authenticated:
+        return frozenset()
+    # в пределах запроса кэш читается не более одного раза на набор
+    relations = getattr(request, '_relation_ids', None)
+    if relations is None:
+        relations = request._relation_ids = {}
+    if name not in relations:
+        relations[name] = get_relation_ids(name, request.user.pk)
+    return relations[name]
+
+
+def tag_version_key(tag):
+    return f'tag-version:{tag}'
+
+
+def get_tag_versions(tags):
+    keys = {tag: tag_version_key(tag) for tag in tags}
+    stored = cache.get_many(keys.values())
+    versions = {}
+    for tag, key in keys.items():
+        if key not in stored:
+            # начальная версия уникальна, чтобы вытесненный счетчик
+            # не совпал со старыми записями
+            cache.add(key, time.time_ns(), None)
+            stored[key] = cache.get(key)
+        versions[tag] = stored[key]
+    return versions
+
+
+def bump_tags(tags):
+    for tag in tags:
+        key = tag_version_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def count_response_cache(outcome):
+    key = f'response-cache:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def response_cache_stats():
+    stats = cache.get_many(('response-cache:hits', 'response-cache:misses'))
+    return {
+        'hits': stats.get('response-cache:hits', 0),
+        'misses': stats.get('response-cache:misses', 0),
+    }
+
+
+def response_cache_key(request):
+    params = sorted(
+        (name, value)
+        for name in request.query_params
+        for value in set(request.query_params.getlist(name))
+        if value
+    )
+    raw = f'{request.path}?{urlencode(params)}'
+    return 'response:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def get_cached_response_data(key):
+    entry = cache.get(key)
+    if entry is None or get_tag_versions(entry['tags']) != entry['tags']:
+        count_response_cache('misses')
+        return None
+    count_response_cache('hits')
+    return entry['data']
+
+
+def cache_response_data(key, data, tags):
+    cache.set(
+        key,
+        {'data': data, 'tags': get_tag_versions(tags)},
+        settings.RESPONSE_CACHE_TIMEOUT,
+    )
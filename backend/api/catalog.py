@@ -0,0 +1,55 @@
+import gzip
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from api.cache import get_tag_versions
+
+INGREDIENTS_CATALOG = 'catalog:ingredients'
+TAGS_CATALOG = 'catalog:tags'
+# входит в ключ кэша: снимки прежнего формата не читаются
+SNAPSHOT_FORMAT_VERSION = 2
+
+
+def get_snapshot(catalog, build):
+    version = get_tag_versions((catalog,))[catalog]
+    key = f'snapshot:{catalog}:{version}:{SNAPSHOT_FORMAT_VERSION}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        body = json.dumps(
+            build(), ensure_ascii=False, separators=(',', ':'),
+        ).encode()
+        digest = hashlib.sha256(body).hexdigest()
+        # у сжатого и несжатого ответа разные байты, поэтому
+        # сильные ETag у них тоже разные
+        snapshot = {
+            'etags': {'identity': f'"{digest}"', 'gzip': f'"{digest}-gzip"'},
+            'identity': body,
+            'gzip': gzip.compress(body),
+        }
+        cache.set(key, snapshot, settings.CATALOG_CACHE_TIMEOUT)
+    return snapshot
+
+
+def snapshot_response(request, catalog, build):
+    snapshot = get_snapshot(catalog, build)
+    encoding = (
+        'gzip' if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        else 'identity'
+    )
+    etag = snapshot['etags'][encoding]
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(
+            snapshot[encoding], content_type='application/json',
+        )
+        if encoding == 'gzip':
+            response['Content-Encoding'] = 'gzip'
+        response['Content-Length'] = len(snapshot[encoding])
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
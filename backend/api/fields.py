@@ -0,0 +1,73 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.storage import default_storage
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework.fields import ImageField, get_error_detail
+from rest_framework.serializers import Field, ValidationError
+
+from recipes.images import variant_name, variant_urls
+
+
+class RecipeImageField(Field):
+    """Адрес изображения рецепта или его уменьшенной копии.
+
+    Пока копии не созданы командой generate_thumbnails, вместо них
+    отдается оригинал.
+    """
+
+    def __init__(self, variant=None, **kwargs):
+        kwargs['read_only'] = True
+        kwargs['source'] = '*'
+        self.variant = variant
+        super().__init__(**kwargs)
+
+    def absolute_url(self, url):
+        request = self.context.get('request')
+        if request is None or url is None:
+            return url
+        return request.build_absolute_uri(url)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        if self.variant is None or not recipe.image_variants_ready:
+            return self.absolute_url(recipe.image.url)
+        return self.absolute_url(
+            default_storage.url(variant_name(recipe.image.name, self.variant))
+        )
+
+
+class RecipeImageVariantsField(RecipeImageField):
+    """Адреса всех уменьшенных копий изображения в форматах JPEG и WebP."""
+
+    def to_representation(self, recipe):
+        if not recipe.image or not recipe.image_variants_ready:
+            return None
+        return {
+            variant: {
+                image_format: self.absolute_url(url)
+                for image_format, url in urls.items()
+            }
+            for variant, urls in variant_urls(recipe.image.name).items()
+        }
+
+
+class RecipeImageUploadField(Base64ImageField):
+    """Изображение строкой base64 или файлом из multipart/form-data.
+
+    Декодирование и проверка изображения выполняются в decode,
+    после проверки остальных полей рецепта.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, (str, UploadedFile)):
+            self.fail('invalid')
+        return data
+
+    def decode(self, data):
+        try:
+            if isinstance(data, UploadedFile):
+                return ImageField.to_internal_value(self, data)
+            return super().to_internal_value(data)
+        except DjangoValidationError as error:
+            raise ValidationError(get_error_detail(error))
@@ -1,12 +1,35 @@
+from django.db.models import Exists, OuterRef
 from django_filters import FilterSet
 from django_filters.rest_framework import filters
-from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe
+from api.recipe_index import filter_recipe_ids, recipe_index
+from api.tag_index import tag_choices, tag_index
+from recipes.models import Recipe, TagRecipe
+from recipes.search import search_recipes
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+
+# порядок выдачи: поля сортировки, для каждого набора есть индекс
+# параметры, которые выбирают рецепты по индексу ингредиентов
+INGREDIENT_FILTERS = (
+    'ingredients', 'any_ingredients', 'exclude_ingredients',
+)
+RECIPE_ORDERINGS = {
+    'newest': ('-pub_date', '-id'),
+    'popular': ('-favorites_count', '-pub_date', '-id'),
+    'quickest': ('cooking_time', '-pub_date', '-id'),
+}
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    # варианты берутся из словаря тегов в памяти процесса, фильтр -
+    # EXISTS по связям, поэтому рецепты не дублируются и DISTINCT не нужен
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices, method='filter_tags',
+    )
     is_favorited = filters.BooleanFilter(
         field_name='is_favorited',
         method='filter_is_favorited',
@@ -15,10 +38,63 @@ class RecipeFilter(FilterSet):
         field_name='is_favorited',
         method='filter_is_in_shopping_cart',
     )
+    search = filters.CharFilter(method='filter_search')
+    # фильтры по ингредиентам применяются вместе в filter_queryset
+    ingredients = NumberInFilter(method='filter_by_index')
+    any_ingredients = NumberInFilter(method='filter_by_index')
+    exclude_ingredients = NumberInFilter(method='filter_by_index')
+    max_missing = filters.NumberFilter(method='filter_by_index')
+    cooking_time_min = filters.NumberFilter(
+        field_name='cooking_time', lookup_expr='gte',
+    )
+    cooking_time_max = filters.NumberFilter(
+        field_name='cooking_time', lookup_expr='lte',
+    )
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',)
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart', 'search',
+            'ingredients', 'any_ingredients', 'exclude_ingredients',
+            'max_missing', 'cooking_time_min', 'cooking_time_max', 'ordering',
+        )
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        data = self.form.cleaned_data
+        include, any_of, exclude = (
+            [int(pk) for pk in data.get(name) or ()]
+            for name in INGREDIENT_FILTERS
+        )
+        if not (include or any_of or exclude):
+            return queryset
+        max_missing = data.get('max_missing')
+        recipe_ids, excluded_ids = recipe_index.select(
+            include, any_of, exclude,
+            None if max_missing is None else int(max_missing),
+        )
+        if recipe_ids is not None:
+            return filter_recipe_ids(queryset, recipe_ids)
+        if excluded_ids:
+            return filter_recipe_ids(queryset, excluded_ids, exclude=True)
+        return queryset
+
+    def filter_by_index(self, queryset, name, value):
+        return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
+    def filter_tags(self, queryset, name, value):
+        tag_ids = tag_index.get_ids()
+        return queryset.filter(Exists(TagRecipe.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=[tag_ids[slug] for slug in value if slug in tag_ids],
+        )))
 
     def filter_is_favorited(self, queryset, name, value):
         if value:
@@ -30,6 +106,7 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
 
-
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
+    def filter_search(self, queryset, name, value):
+        if value.strip():
+            return search_recipes(queryset, value.strip())
+        return queryset
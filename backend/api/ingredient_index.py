@@ -0,0 +1,57 @@
+from bisect import bisect_left
+from threading import Lock
+
+from api.cache import get_tag_versions
+from api.catalog import INGREDIENTS_CATALOG
+from recipes.models import Ingredient
+
+
+def normalize(value):
+    return value.lower().replace('ё', 'е')
+
+
+class IngredientIndex:
+
+    def __init__(self):
+        self.version = None
+        self.entries = ((), ())
+        self.lock = Lock()
+
+    def build(self):
+        ingredients = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: (
+                normalize(item['name']), item['measurement_unit'],
+            ),
+        )
+        # ключи и записи заменяются одновременно, читатели не блокируются
+        self.entries = (
+            tuple(normalize(item['name']) for item in ingredients),
+            tuple(ingredients),
+        )
+
+    def refresh(self):
+        version = get_tag_versions(
+            (INGREDIENTS_CATALOG,)
+        )[INGREDIENTS_CATALOG]
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                self.build()
+                self.version = version
+
+    def search(self, query):
+        self.refresh()
+        keys, items = self.entries
+        query = normalize(query)
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + '\uffff', start)
+        substring_matches = [
+            item for key, item in zip(keys, items)
+            if query in key and not key.startswith(query)
+        ]
+        return [*items[start:end], *substring_matches]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,314 @@
+import json
+import math
+import statistics
+import tempfile
+import time
+import tracemalloc
+from itertools import combinations
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from api.filters import RECIPE_ORDERINGS, RecipeFilter
+from recipes.models import Ingredient, Recipe, ShoppingCart, Tag
+from users.models import User
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1Pe'
+    'AAAADElEQVR4nGP4z8AAAAMBAQDJ/pLvAAAAAElFTkSuQmCC'
+)
+# бюджеты по умолчанию: число SQL-запросов и 95-й перцентиль времени, мс
+DEFAULT_BUDGET = {'queries': 12, 'p95_ms': 500}
+BUDGETS = {
+    # запись рецепта с 30 ингредиентами; уменьшенные копии картинки
+    # создает generate_thumbnails вне запроса
+    'recipe_create': {'queries': 13, 'p95_ms': 500},
+    # плюс имя старой картинки, чтобы удалить ее уменьшенные копии
+    'recipe_update': {'queries': 14, 'p95_ms': 500},
+    # подписка и отписка с пересчетом счетчика и кэша подписок
+    'subscribe_toggle': {'queries': 13, 'p95_ms': 500},
+    'download_shopping_cart_pdf': {'queries': 4, 'p95_ms': 2000},
+    'ingredients_search': {'queries': 0, 'p95_ms': 50},
+    'ingredients_list': {'queries': 0, 'p95_ms': 100},
+    'tags_list': {'queries': 0, 'p95_ms': 50},
+}
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(math.ceil(len(values) * percent / 100) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер времени, числа SQL-запросов и памяти эндпоинтов API на '
+        'временной базе, заполненной generate_fake_data. Запросы '
+        'фиксируют транзакции, поэтому on_commit-обработчики тоже '
+        'попадают в замеры; кэш и медиафайлы отделены от рабочих'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Пользователей во временной базе')
+        parser.add_argument('--recipes', type=int, default=10000,
+                            help='Рецептов во временной базе')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Не удалять временную базу после замеров '
+                                 'и использовать ее повторно')
+        parser.add_argument('--user', help='email пользователя для замеров')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--budgets', help='JSON-файл с бюджетами')
+        parser.add_argument('--compare', help='JSON с прошлым прогоном')
+        parser.add_argument('--tolerance', type=float, default=20,
+                            help='Допустимый рост p95 в процентах')
+
+    def _get_user(self, email):
+        if email:
+            return User.objects.get(email=email)
+        busiest = ShoppingCart.objects.values('user').annotate(
+            total=Count('id')
+        ).order_by('-total').first()
+        if busiest is None:
+            raise CommandError(
+                'The database is empty, run generate_fake_data first.'
+            )
+        return User.objects.get(pk=busiest['user'])
+
+    def _recipe_filter_routes(self, user):
+        samples = {
+            'author': user.pk,
+            'tags': Tag.objects.values_list('slug', flat=True).first(),
+            'is_favorited': 1,
+            'is_in_shopping_cart': 1,
+            'search': 'суп',
+        }
+        names = [name for name in samples if name in RecipeFilter.base_filters]
+        for size in range(1, len(names) + 1):
+            for combination in combinations(names, size):
+                query = '&'.join(f'{name}={samples[name]}'
+                                 for name in combination)
+                yield (
+                    f'recipes_list_{"_".join(combination)}',
+                    'get', f'/api/recipes/?{query}', None,
+                )
+
+    def _routes(self, user):
+        recipe = Recipe.objects.exclude(
+            favorites__user=user
+        ).exclude(shopping_cart__user=user).first()
+        author = User.objects.exclude(pk=user.pk).exclude(
+            subscription__user=user
+        ).first()
+        ingredient_ids = list(
+            Ingredient.objects.values_list('pk', flat=True)[:30]
+        )
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        counter = iter(range(10 ** 9))
+
+        def recipe_data():
+            return {
+                'name': f'Бенчмарк {time.time_ns()}-{next(counter)}',
+                'text': 'Описание', 'cooking_time': 10, 'image': IMAGE,
+                'tags': tag_ids[:2],
+                'ingredients': [{'id': pk, 'amount': 10}
+                                for pk in ingredient_ids],
+            }
+
+        created = self.client.post(
+            '/api/recipes/', recipe_data(), format='json'
+        ).json()
+        yield 'recipes_list', 'get', '/api/recipes/', None
+        yield 'recipes_list_limit_60', 'get', '/api/recipes/?limit=60', None
+        yield ('recipes_list_cursor', 'get',
+               '/api/recipes/?pagination=cursor', None)
+        yield from self._recipe_filter_routes(user)
+        tag = Tag.objects.values_list('slug', flat=True).first()
+        for ordering in RECIPE_ORDERINGS:
+            yield (f'recipes_list_{ordering}_tags', 'get',
+                   f'/api/recipes/?ordering={ordering}&tags={tag}', None)
+            yield (f'recipes_list_{ordering}_cursor', 'get',
+                   f'/api/recipes/?ordering={ordering}&pagination=cursor',
+                   None)
+        yield ('recipes_list_cooking_time', 'get',
+               '/api/recipes/?cooking_time_min=10&cooking_time_max=30'
+               '&ordering=quickest', None)
+        ids = ','.join(map(str, ingredient_ids[:2]))
+        pantry = ','.join(map(str, ingredient_ids[:20]))
+        yield ('recipes_list_ingredients', 'get',
+               f'/api/recipes/?ingredients={ids}', None)
+        yield ('recipes_list_any_exclude_ingredients', 'get',
+               f'/api/recipes/?any_ingredients={ids}'
+               f'&exclude_ingredients={ingredient_ids[2]}', None)
+        yield ('recipes_list_max_missing', 'get',
+               f'/api/recipes/?ingredients={pantry}&max_missing=2', None)
+        yield 'recipe_detail', 'get', f'/api/recipes/{recipe.pk}/', None
+        yield 'recipe_create', 'post', '/api/recipes/', recipe_data
+        yield ('recipe_update', 'patch', f'/api/recipes/{created["id"]}/',
+               recipe_data)
+        for relation in ('favorite', 'shopping_cart'):
+            yield (f'{relation}_toggle', 'toggle',
+                   f'/api/recipes/{recipe.pk}/{relation}/', None)
+        for export_format in ('pdf', 'txt', 'csv'):
+            yield (
+                f'download_shopping_cart_{export_format}', 'get',
+                f'/api/recipes/download_shopping_cart/'
+                f'?format={export_format}',
+                None,
+            )
+        yield ('subscriptions_list', 'get',
+               '/api/users/subscriptions/?recipes_limit=3', None)
+        yield ('subscribe_toggle', 'toggle',
+               f'/api/users/{author.pk}/subscribe/', None)
+        yield 'ingredients_search', 'get', '/api/ingredients/?name=мо', None
+        yield 'ingredients_list', 'get', '/api/ingredients/', None
+        yield 'tags_list', 'get', '/api/tags/', None
+        yield 'users_list', 'get', '/api/users/', None
+        yield 'users_me', 'get', '/api/users/me/', None
+        yield 'users_detail', 'get', f'/api/users/{author.pk}/', None
+
+    def _call(self, method, url, data):
+        if method == 'toggle':
+            responses = (self.client.post(url), self.client.delete(url))
+        else:
+            payload = data() if callable(data) else data
+            responses = (
+                getattr(self.client, method)(url, payload, format='json'),
+            )
+        for response in responses:
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{method.upper()} {url} returned '
+                    f'{response.status_code}: {response.content[:200]}'
+                )
+            if response.streaming:
+                b''.join(response.streaming_content)
+
+    def _measure(self, method, url, data, iterations):
+        # первый вызов прогревает кэши и не учитывается
+        self._call(method, url, data)
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            self._call(method, url, data)
+            timings.append((time.perf_counter() - start) * 1000)
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as context:
+            self._call(method, url, data)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {
+            'p50_ms': round(statistics.median(timings), 2),
+            'p90_ms': round(percentile(timings, 90), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'queries': len(context),
+            'peak_memory_kb': round(peak_memory / 1024, 1),
+        }
+
+    def _check(self, results, budgets, previous, tolerance):
+        failures = []
+        for name, result in results.items():
+            budget = {**DEFAULT_BUDGET, **budgets.get(name, {})}
+            if result['queries'] > budget['queries']:
+                failures.append(
+                    f'{name}: {result["queries"]} queries, '
+                    f'budget {budget["queries"]}'
+                )
+            if result['p95_ms'] > budget['p95_ms']:
+                failures.append(
+                    f'{name}: p95 {result["p95_ms"]} ms, '
+                    f'budget {budget["p95_ms"]} ms'
+                )
+            before = previous.get(name)
+            if before is None:
+                continue
+            if result['queries'] > before['queries']:
+                failures.append(
+                    f'{name}: {result["queries"]} queries, '
+                    f'previous run {before["queries"]}'
+                )
+            if result['p95_ms'] > before['p95_ms'] * (1 + tolerance / 100):
+                failures.append(
+                    f'{name}: p95 {result["p95_ms"]} ms, '
+                    f'previous run {before["p95_ms"]} ms'
+                )
+        return failures
+
+    def _fill_database(self, options):
+        if Recipe.objects.exists():
+            return
+        call_command('load_data', stdout=self.stdout)
+        call_command(
+            'generate_fake_data', users=options['users'],
+            recipes=options['recipes'], seed=options['seed'],
+            stdout=self.stdout,
+        )
+
+    def _run(self, options):
+        user = self._get_user(options['user'])
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        results = {}
+        for name, method, url, data in self._routes(user):
+            results[name] = self._measure(
+                method, url, data, options['iterations']
+            )
+            self.stdout.write(
+                f'{name}: p95 {results[name]["p95_ms"]} ms, '
+                f'{results[name]["queries"]} queries'
+            )
+        return results
+
+    def handle(self, *args, **options):
+        budgets = dict(BUDGETS)
+        if options['budgets']:
+            with open(options['budgets'], encoding='utf-8') as file:
+                budgets.update(json.load(file))
+        previous = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['results']
+        # замеры меняют данные и кэш, поэтому идут на временной базе
+        # (как у тестов), с отдельным кэшем и каталогом медиафайлов
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            CACHES={'default': settings.CACHES['benchmark']},
+            MEDIA_ROOT=media_root,
+        ):
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False,
+                keepdb=options['keepdb'],
+            )
+            try:
+                cache.clear()
+                self._fill_database(options)
+                results = self._run(options)
+                recipes = Recipe.objects.count()
+            finally:
+                cache.clear()
+                connection.creation.destroy_test_db(
+                    old_name, verbosity=0, keepdb=options['keepdb'],
+                )
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump({
+                'vendor': connection.vendor,
+                'recipes': recipes,
+                'iterations': options['iterations'],
+                'results': results,
+            }, file, ensure_ascii=False, indent=2)
+        failures = self._check(
+            results, budgets, previous, options['tolerance']
+        )
+        if failures:
+            raise CommandError(
+                'Benchmark budgets exceeded:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(
+            f'Benchmark results are saved to {options["output"]}'
+        )
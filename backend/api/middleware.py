@@ -0,0 +1,95 @@
+import json
+import logging
+import re
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger('api.sql')
+
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_LISTS = re.compile(r'\((?:\s*(?:\?|%s)\s*,)+\s*(?:\?|%s)\s*\)')
+
+
+def normalize_sql(sql):
+    return SQL_LISTS.sub('(...)', SQL_LITERALS.sub('?', sql))
+
+
+def query_origin():
+    # ближайший к запросу кадр кода api, например
+    # RecipeListSerializer.get_is_favorited
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith('api.') and module != __name__:
+            instance = frame.f_locals.get('self')
+            owner = type(instance).__name__ if instance is not None else module
+            return f'{owner}.{frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+class QueryInstrumentationMiddleware:
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = []
+
+        def record_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append((
+                    sql, (time.perf_counter() - start) * 1000, query_origin(),
+                ))
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(record_query):
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+        sql_ms = sum(duration for _, duration, _ in queries)
+        response['Server-Timing'] = (
+            f'db;dur={sql_ms:.1f};desc="{len(queries)} queries", '
+            f'app;dur={total_ms - sql_ms:.1f}, total;dur={total_ms:.1f}'
+        )
+        repeated = defaultdict(list)
+        for sql, _, origin in queries:
+            repeated[normalize_sql(sql)].append(origin)
+        n_plus_one = [
+            {
+                'sql': sql,
+                'count': len(origins),
+                'origins': sorted({str(origin) for origin in origins}),
+            }
+            for sql, origins in repeated.items()
+            if len(origins) > settings.QUERY_INSTRUMENTATION_REPEAT_LIMIT
+        ]
+        slowest = sorted(queries, key=lambda query: query[1], reverse=True)
+        logger.log(
+            logging.WARNING if n_plus_one else logging.INFO,
+            json.dumps({
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'total_ms': round(total_ms, 2),
+                'sql_ms': round(sql_ms, 2),
+                'sql_count': len(queries),
+                'slowest': [
+                    {'sql': sql, 'ms': round(duration, 2), 'origin': origin}
+                    for sql, duration, origin in slowest[
+                        :settings.QUERY_INSTRUMENTATION_SLOWEST
+                    ]
+                ],
+                'n_plus_one': n_plus_one,
+            }, ensure_ascii=False),
+        )
+        return response
@@ -1,6 +1,117 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor, CursorPagination, PageNumberPagination, _reverse_ordering,
+)
 
 
 class LimitCustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = 6
+
+
+class LimitCursorPagination(CursorPagination):
+    """Курсор по всем полям сортировки (keyset).
+
+    Порядок берется из queryset, если его задали фильтры (ordering,
+    search), и всегда заканчивается уникальным id, поэтому смещение
+    внутри одинаковых значений не нужно.
+    """
+    page_size_query_param = 'limit'
+    page_size = 6
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(
+            field for field in queryset.query.order_by
+            if isinstance(field, str)
+        ) or super().get_ordering(request, queryset, view)
+        if not {'id', '-id', 'pk', '-pk'} & set(ordering):
+            ordering += ('-id',)
+        return ordering
+
+    def _get_position_from_instance(self, instance, ordering):
+        return json.dumps(
+            [getattr(instance, field.lstrip('-')) for field in ordering],
+            # str() сохраняет микросекунды даты публикации
+            default=str,
+        )
+
+    def get_keyset_filter(self, ordering, position):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        conditions, equal = [], Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            conditions.append(equal & Q(**{f'{name}__{lookup}': value}))
+            equal &= Q(**{name: value})
+        return reduce(or_, conditions)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse, current_position = (
+            (False, None) if self.cursor is None
+            else (self.cursor.reverse, self.cursor.position)
+        )
+        ordering = (
+            _reverse_ordering(self.ordering) if reverse else self.ordering
+        )
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            queryset = queryset.filter(
+                self.get_keyset_filter(ordering, current_position)
+            )
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+        # соседние страницы начинаются строго после последнего
+        # и строго перед первым элементом текущей
+        self.next_position = self.previous_position = current_position
+        if self.page:
+            self.previous_position = self._get_position_from_instance(
+                self.page[0], self.ordering
+            )
+            self.next_position = self._get_position_from_instance(
+                self.page[-1], self.ordering
+            )
+        self.has_next = current_position is not None if reverse else has_more
+        self.has_previous = (
+            has_more if reverse else current_position is not None
+        )
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.next_position)
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self.previous_position)
+        )
+
+
+class SubscriptionCursorPagination(LimitCursorPagination):
+    ordering = ('username',)
@@ -0,0 +1,193 @@
+import json
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import chain
+from threading import Lock
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from api.cache import get_tag_versions, tag_version_key
+from recipes.models import IngredientRecipe, Recipe
+
+RECIPE_INDEX = 'index:recipe-ingredients'
+# изменения связей хранятся в кэше под номерами версий индекса,
+# при большем отставании процесс перестраивает индекс целиком
+CHANGE_LOG_LIMIT = 1000
+CHANGE_LOG_TIMEOUT = 60 * 60
+BUILD_CHUNK_SIZE = 10000
+
+
+def change_key(version):
+    return f'{RECIPE_INDEX}:change:{version}'
+
+
+def log_changes(changes):
+    """Сохраняет изменения связей (знак, ингредиент, рецепт) для всех
+    процессов."""
+    if not changes:
+        return
+    key = tag_version_key(RECIPE_INDEX)
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        # без версии все процессы перестроят индекс сами
+        cache.set(key, time.time_ns(), None)
+        return
+    cache.set(change_key(version), tuple(changes), CHANGE_LOG_TIMEOUT)
+
+
+def log_changes_on_commit(changes):
+    changes = tuple(changes)
+    transaction.on_commit(lambda: log_changes(changes))
+
+
+def filter_recipe_ids(queryset, recipe_ids, exclude=False):
+    """Фильтр по набору id одним параметром запроса."""
+    recipe_ids = sorted(recipe_ids)
+    column = f'{Recipe._meta.db_table}.id'
+    if connection.vendor == 'postgresql':
+        condition = RawSQL(
+            f'{column} = ANY(%s)', (recipe_ids,), output_field=BooleanField()
+        )
+    elif connection.vendor == 'sqlite':
+        condition = RawSQL(
+            f'{column} IN (SELECT value FROM json_each(%s))',
+            (json.dumps(recipe_ids),), output_field=BooleanField(),
+        )
+    elif exclude:
+        return queryset.exclude(id__in=recipe_ids)
+    else:
+        return queryset.filter(id__in=recipe_ids)
+    if exclude:
+        return queryset.exclude(condition)
+    return queryset.filter(condition)
+
+
+class RecipeIngredientIndex:
+    """Инвертированный индекс: ингредиент -> отсортированные id рецептов.
+
+    Пересечения и объединения списков выполняются операциями над
+    множествами и Counter, которые работают на уровне C.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.postings = {}
+        self.sizes = array('H')
+        self.lock = Lock()
+
+    def build(self):
+        postings, sizes = {}, array('H')
+        links = IngredientRecipe.objects.order_by(
+            'ingredient_id', 'recipe_id'
+        ).values_list('ingredient_id', 'recipe_id')
+        for ingredient_id, recipe_id in links.iterator(
+            chunk_size=BUILD_CHUNK_SIZE
+        ):
+            recipes = postings.get(ingredient_id)
+            if recipes is None:
+                recipes = postings[ingredient_id] = array('l')
+            recipes.append(recipe_id)
+            if recipe_id >= len(sizes):
+                sizes.extend(bytes(2 * (recipe_id + 1 - len(sizes))))
+            sizes[recipe_id] += 1
+        self.postings, self.sizes = postings, sizes
+
+    def apply(self, changes):
+        # измененные списки и счетчики копируются, а не меняются на месте:
+        # select работает со снимком без блокировки
+        postings, sizes = dict(self.postings), array('H', self.sizes)
+        copied = set()
+        for delta, ingredient_id, recipe_id in changes:
+            if ingredient_id not in copied:
+                postings[ingredient_id] = array(
+                    'l', postings.get(ingredient_id, ())
+                )
+                copied.add(ingredient_id)
+            recipes = postings[ingredient_id]
+            position = bisect_left(recipes, recipe_id)
+            present = (
+                position < len(recipes) and recipes[position] == recipe_id
+            )
+            # повторное применение изменения ничего не меняет
+            if delta > 0 and not present:
+                insort(recipes, recipe_id)
+            elif delta < 0 and present:
+                del recipes[position]
+            else:
+                continue
+            if recipe_id >= len(sizes):
+                sizes.extend(bytes(2 * (recipe_id + 1 - len(sizes))))
+            sizes[recipe_id] += delta
+        self.postings, self.sizes = postings, sizes
+
+    def refresh(self):
+        version = get_tag_versions((RECIPE_INDEX,))[RECIPE_INDEX]
+        if version == self.version:
+            return
+        if (
+            self.version is None or version < self.version
+            or version - self.version > CHANGE_LOG_LIMIT
+        ):
+            changes = None
+        else:
+            keys = [
+                change_key(number)
+                for number in range(self.version + 1, version + 1)
+            ]
+            stored = cache.get_many(keys)
+            changes = (
+                [stored[key] for key in keys]
+                if len(stored) == len(keys) else None
+            )
+        if changes is None:
+            self.build()
+        else:
+            self.apply(chain.from_iterable(changes))
+        self.version = version
+
+    def select(self, include=(), any_of=(), exclude=(), max_missing=None):
+        """Возвращает (id подходящих рецептов, id исключаемых рецептов).
+
+        Первый элемент равен None, если положительных условий нет.
+        С max_missing include - это продукты, которые есть у пользователя:
+        подходят рецепты, которым не хватает не более max_missing
+        ингредиентов.
+        """
+        with self.lock:
+            self.refresh()
+            postings, sizes = self.postings, self.sizes
+        empty = array('l')
+        result = None
+        if include and max_missing is not None:
+            matched = Counter()
+            for ingredient_id in set(include):
+                matched.update(postings.get(ingredient_id, empty))
+            result = {
+                recipe_id for recipe_id, count in matched.items()
+                if sizes[recipe_id] - count <= max_missing
+            }
+        elif include:
+            lists = sorted(
+                (postings.get(pk, empty) for pk in set(include)), key=len,
+            )
+            result = set(lists[0])
+            for recipes in lists[1:]:
+                if not result:
+                    break
+                result.intersection_update(recipes)
+        if any_of:
+            found = set().union(*(postings.get(pk, empty) for pk in any_of))
+            result = found if result is None else result & found
+        excluded = set().union(*(postings.get(pk, empty) for pk in exclude))
+        if result is not None:
+            return result - excluded, set()
+        return None, excluded
+
+
+recipe_index = RecipeIngredientIndex()
@@ -0,0 +1,100 @@
+from django.db import connection, transaction
+from django.db.models import F
+
+from api.cache import POPULAR_LIST, bump_tags, invalidate_relation_ids
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+# кэш связей пользователя, счетчик рецепта и списки, упорядоченные
+# по этому счетчику, для каждой модели связи
+RELATION_COUNTERS = {
+    Favorite: ('favorites', 'favorites_count', (POPULAR_LIST,)),
+    ShoppingCart: ('shopping_cart', 'in_carts_count', ()),
+}
+ADDED = 'added'
+ALREADY_ADDED = 'already_added'
+REMOVED = 'removed'
+NOT_ADDED = 'not_added'
+NOT_FOUND = 'not_found'
+
+
+def insert_relations(model, user_id, recipe_ids):
+    """Добавляет связи одним запросом и возвращает id рецептов,
+    для которых строка действительно вставлена.
+
+    Связи, добавленные параллельным запросом, и рецепты, удаленные
+    после проверки, пропускаются базой и не попадают в счетчики.
+    """
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {model._meta.db_table} (user_id, recipe_id) '
+            f'SELECT %s, id FROM {Recipe._meta.db_table} '
+            f'WHERE id IN ({placeholders}) '
+            f'ON CONFLICT DO NOTHING RETURNING recipe_id',
+            [user_id, *recipe_ids],
+        )
+        return {recipe_id for recipe_id, in cursor.fetchall()}
+
+
+def delete_relations(model, user_id, recipe_ids):
+    """Удаляет связи одним запросом и возвращает id рецептов,
+    для которых строка действительно удалена."""
+    # queryset.delete() загружает строки ради сигналов
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {model._meta.db_table} '
+            f'WHERE user_id = %s AND recipe_id IN ({placeholders}) '
+            f'RETURNING recipe_id',
+            [user_id, *recipe_ids],
+        )
+        return {recipe_id for recipe_id, in cursor.fetchall()}
+
+
+def change_counters(field, recipe_ids, delta):
+    queryset = Recipe.objects.filter(pk__in=recipe_ids)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+@transaction.atomic
+def apply_relation_batch(model, user, add_ids, remove_ids):
+    """Добавляет и удаляет связи пользователя с рецептами набором.
+
+    Вставка и удаление одним запросом минуют сигналы, поэтому
+    счетчики рецептов и кэш связей обновляются здесь же - по строкам,
+    которые база действительно изменила, чтобы параллельные наборы
+    не изменили счетчик дважды.
+    """
+    relation, counter, lists = RELATION_COUNTERS[model]
+    recipes = set(Recipe.objects.filter(
+        pk__in={*add_ids, *remove_ids}
+    ).values_list('pk', flat=True))
+    added = insert_relations(model, user.pk, add_ids) if add_ids else set()
+    removed = (
+        delete_relations(model, user.pk, remove_ids) if remove_ids else set()
+    )
+    if added:
+        change_counters(counter, added, 1)
+    if removed:
+        change_counters(counter, removed, -1)
+    if added or removed:
+        transaction.on_commit(
+            lambda: invalidate_relation_ids(relation, user.pk)
+        )
+        transaction.on_commit(lambda: bump_tags(lists))
+    results = []
+    for pk in add_ids:
+        if pk not in recipes:
+            status = NOT_FOUND
+        else:
+            status = ADDED if pk in added else ALREADY_ADDED
+        results.append({'id': pk, 'action': 'add', 'status': status})
+    for pk in remove_ids:
+        if pk not in recipes:
+            status = NOT_FOUND
+        else:
+            status = REMOVED if pk in removed else NOT_ADDED
+        results.append({'id': pk, 'action': 'remove', 'status': status})
+    return results
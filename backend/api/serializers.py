@@ -1,13 +1,23 @@
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework.serializers import (
     CurrentUserDefault, IntegerField,
     ListField, ModelSerializer,
     PrimaryKeyRelatedField, ReadOnlyField,
-    SerializerMethodField, ValidationError,
+    Serializer, SerializerMethodField, ValidationError,
 )
+from rest_framework.utils import html
 from rest_framework.validators import UniqueTogetherValidator
 
+from api.cache import user_relation_ids
+from api.fields import (
+    RecipeImageField, RecipeImageUploadField, RecipeImageVariantsField,
+)
+from api.recipe_index import log_changes_on_commit
 from api.validators import ChangeResponseStatusValidationError
 from recipes.models import (
     Favorite, Ingredient, IngredientRecipe,
@@ -28,10 +38,11 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        return (request
-                and request.user.is_authenticated
-                and obj.subscription.filter(user=request.user).exists())
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.id in user_relation_ids(
+            self.context.get('request'), 'subscriptions'
+        )
 
 
 class TagSerializer(ModelSerializer):
@@ -57,6 +68,17 @@ class IngredientSerializer(ModelSerializer):
         ]
 
 
+def recipe_ingredient_links():
+    """Ингредиенты рецепта в порядке вывода - по наименованию.
+
+    Порядок задается при чтении: новые связи при изменении рецепта
+    добавляются после сохранившихся.
+    """
+    return IngredientRecipe.objects.select_related(
+        'ingredient'
+    ).order_by('-ingredient__name')
+
+
 class IngredientRecipeListSerializer(ModelSerializer):
     id = ReadOnlyField(source='ingredient.id')
     name = ReadOnlyField(source='ingredient.name')
@@ -74,6 +96,8 @@ class RecipeListSerializer(ModelSerializer):
     ingredients = SerializerMethodField()
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
+    image = RecipeImageField('medium')
+    image_variants = RecipeImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -81,28 +105,30 @@ class RecipeListSerializer(ModelSerializer):
             'id', 'tags',
             'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image',
+            'name', 'image', 'image_variants',
             'text', 'cooking_time',
         )
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        return (request
-                and request.user.is_authenticated
-                and obj.favorites.filter(user=request.user).exists())
+        return obj.id in user_relation_ids(
+            self.context.get('request'), 'favorites'
+        )
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        return (request
-                and request.user.is_authenticated
-                and obj.shopping_cart.filter(user=request.user).exists())
+        return obj.id in user_relation_ids(
+            self.context.get('request'), 'shopping_cart'
+        )
 
     def get_ingredients(self, obj):
         return IngredientRecipeListSerializer(
-            IngredientRecipe.objects.filter(recipe=obj), many=True
+            obj.ingredientrecipe_set.all(), many=True
         ).data
 
 
+class RecipeDetailSerializer(RecipeListSerializer):
+    image = RecipeImageField()
+
+
 class IngredientRecipeSerializer(ModelSerializer):
     # id = PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
     id = IntegerField()
@@ -112,24 +138,15 @@ class IngredientRecipeSerializer(ModelSerializer):
         model = IngredientRecipe
         fields = ('id', 'amount',)
 
-    # валидация для вывода статуса ответа - 404
-    def validate(self, data):
-        id_ingredient = data.get('id')
-        if not Ingredient.objects.filter(id=id_ingredient).exists():
-            raise ChangeResponseStatusValidationError({
-                'detail': f'Ингредиент c id "{id_ingredient}" не существует'
-            })
-        return data
-
 
 class RecipeSerializer(ModelSerializer):
     author = PrimaryKeyRelatedField(
         read_only=True,
         default=CurrentUserDefault()
     )
-    image = Base64ImageField()
+    image = RecipeImageUploadField()
     ingredients = IngredientRecipeSerializer(many=True)
-    tags = ListField()
+    tags = ListField(child=IntegerField())
     cooking_time = IntegerField()
     # tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
 
@@ -149,20 +166,81 @@ class RecipeSerializer(ModelSerializer):
         )
     ]
 
+    def parse_form_data(self, data):
+        # в multipart/form-data ингредиенты передаются JSON-строкой,
+        # а теги - JSON-строкой или повторяющимся полем
+        parsed = {
+            key: data.get(key) for key in data
+            if not key.startswith('ingredients[')
+        }
+        if 'ingredients' in data:
+            try:
+                parsed['ingredients'] = json.loads(data.get('ingredients'))
+            except ValueError:
+                raise ValidationError({
+                    'ingredients': 'Ожидается список ингредиентов в JSON.'
+                })
+        else:
+            ingredients = html.parse_html_list(data, prefix='ingredients')
+            if ingredients:
+                parsed['ingredients'] = ingredients
+        if 'tags' in data:
+            tags = data.getlist('tags')
+            if len(tags) == 1 and tags[0].lstrip().startswith('['):
+                try:
+                    tags = json.loads(tags[0])
+                except ValueError:
+                    raise ValidationError({
+                        'tags': 'Ожидается список тегов в JSON.'
+                    })
+            parsed['tags'] = tags
+        return parsed
+
+    def to_internal_value(self, data):
+        if html.is_html_input(data):
+            data = self.parse_form_data(data)
+        return super().to_internal_value(data)
+
+    def validate_image_last(self, data):
+        # изображение декодируется только после дешевых проверок
+        if 'image' not in data:
+            return data
+        try:
+            data['image'] = self.fields['image'].decode(data['image'])
+        except ValidationError as error:
+            raise ValidationError({'image': error.detail})
+        return data
+
+    # валидация для вывода статуса ответа - 404
+    def validate_ingredients(self, ingredients):
+        existing = Ingredient.objects.in_bulk(
+            [ingredient.get('id') for ingredient in ingredients]
+        )
+        for ingredient in ingredients:
+            id_ingredient = ingredient.get('id')
+            if id_ingredient not in existing:
+                raise ChangeResponseStatusValidationError({
+                    'detail':
+                    f'Ингредиент c id "{id_ingredient}" не существует'
+                })
+            ingredient['ingredient'] = existing[id_ingredient]
+        return ingredients
+
     def validate(self, data):
         ingredients = data.get('ingredients')
-        unique_ingredients = []
+        unique_ingredients = set()
         id_tags = data.get('tags')
         for ingredient in ingredients:
             if ingredient.get('amount') <= 0:
                 raise ValidationError({
                     'amount': 'Минимальное количество ингредиентов - 1 ед.'
                 })
-            if ingredient in unique_ingredients:
+            # один ингредиент с разным количеством - тоже повтор
+            if ingredient.get('id') in unique_ingredients:
                 raise ValidationError({
                     'ingredients': 'Выбраны повторяющиеся ингредиенты.'
                 })
-            unique_ingredients.append(ingredient)
+            unique_ingredients.add(ingredient.get('id'))
         if data.get('cooking_time') <= 0:
             raise ValidationError({
                 'cooking_time': 'Минимальное время приготовления - 1 минута.'
@@ -177,8 +255,11 @@ class RecipeSerializer(ModelSerializer):
                 'tags': 'Добавьте хотя бы один тег.'
             })
         # валидация для вывода статуса ответа - 404
+        existing_tags = set(
+            Tag.objects.filter(id__in=id_tags).values_list('id', flat=True)
+        )
         for id_tag in id_tags:
-            if not Tag.objects.filter(id=id_tag).exists():
+            if id_tag not in existing_tags:
                 raise ChangeResponseStatusValidationError({
                     'detail': f'Тег c id "{id_tag}" не существует'
                 })
@@ -186,22 +267,46 @@ class RecipeSerializer(ModelSerializer):
                 raise ValidationError({
                     'tags': 'Выбраны повторяющиеся теги.'
                 })
-        return data
+        return self.validate_image_last(data)
 
     def create_link_ingredients(self, ingredients, recipe):
         ingredient_list = [
             IngredientRecipe(
                 recipe=recipe,
-                ingredient_id=ingredient.get('id'),
+                ingredient=ingredient.get('ingredient'),
                 amount=ingredient.get('amount'),
             )for ingredient in ingredients
         ]
-        ingredient_list.sort(
-            key=lambda element: element.ingredient.name,
-            reverse=True
-        )
         IngredientRecipe.objects.bulk_create(objs=ingredient_list)
+        # bulk_create минует сигналы, индекс ингредиентов обновляется здесь
+        log_changes_on_commit(
+            (1, link.ingredient_id, recipe.pk) for link in ingredient_list
+        )
 
+    def update_link_ingredients(self, ingredients, recipe):
+        # изменяются только связи, которые отличаются от текущих
+        links = {
+            link.ingredient_id: link
+            for link in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        new_ingredients, changed_links = [], []
+        for ingredient in ingredients:
+            link = links.pop(ingredient.get('id'), None)
+            if link is None:
+                new_ingredients.append(ingredient)
+            elif link.amount != ingredient.get('amount'):
+                link.amount = ingredient.get('amount')
+                changed_links.append(link)
+        if links:
+            IngredientRecipe.objects.filter(
+                pk__in=[link.pk for link in links.values()]
+            ).delete()
+        if changed_links:
+            IngredientRecipe.objects.bulk_update(changed_links, ('amount',))
+        if new_ingredients:
+            self.create_link_ingredients(new_ingredients, recipe)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         id_tags = validated_data.pop('tags')
@@ -209,33 +314,43 @@ class RecipeSerializer(ModelSerializer):
             **validated_data,
             author=self.context.get('request').user,
         )
-        recipe.tags.set(id_tags)
+        recipe.tags.add(*id_tags)
         self.create_link_ingredients(ingredients, recipe)
         return recipe
 
     def to_representation(self, instance):
-        return RecipeListSerializer(instance, context=self.context).data
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'ingredientrecipe_set', queryset=recipe_ingredient_links(),
+            ),
+        )
+        return RecipeDetailSerializer(instance, context=self.context).data
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
         id_tags = validated_data.pop('tags')
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-        instance.tags.clear()
+        # set() добавляет и удаляет только отличающиеся теги
         instance.tags.set(id_tags)
-        self.create_link_ingredients(ingredients, instance)
+        self.update_link_ingredients(ingredients, instance)
         return super().update(instance, validated_data)
 
 
 class ShortRecipeSerializer(ModelSerializer):
+    image = RecipeImageField('thumbnail')
+    image_variants = RecipeImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time',)
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time',)
         read_only_field = '__all__'
 
 
 class SubscriptionListSerializer(CustomUserSerializer):
     recipes = SerializerMethodField()
-    recipes_count = SerializerMethodField()
+    recipes_count = ReadOnlyField()
 
     class Meta(CustomUserSerializer.Meta):
         fields = (
@@ -244,6 +359,8 @@ class SubscriptionListSerializer(CustomUserSerializer):
         )
 
     def get_recipes(self, obj):
+        if hasattr(obj, 'latest_recipes'):
+            return ShortRecipeSerializer(obj.latest_recipes, many=True).data
         request = self.context.get('request')
         if not request:
             return False
@@ -253,9 +370,6 @@ class SubscriptionListSerializer(CustomUserSerializer):
             recipes = recipes[:int(limit)]
         return ShortRecipeSerializer(recipes, many=True).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class FavoriteSerializer(ModelSerializer):
 
@@ -278,6 +392,32 @@ class FavoriteSerializer(ModelSerializer):
         ).data
 
 
+class RelationBatchSerializer(Serializer):
+    add = ListField(
+        child=IntegerField(min_value=1), required=False, default=list,
+        max_length=settings.RELATION_BATCH_MAX_SIZE,
+    )
+    remove = ListField(
+        child=IntegerField(min_value=1), required=False, default=list,
+        max_length=settings.RELATION_BATCH_MAX_SIZE,
+    )
+
+    def validate(self, data):
+        add_ids, remove_ids = data.get('add'), data.get('remove')
+        if not add_ids and not remove_ids:
+            raise ValidationError({
+                'error': 'Укажите рецепты для добавления или удаления.'
+            })
+        if len(set(add_ids)) < len(add_ids) or (
+                len(set(remove_ids)) < len(remove_ids)):
+            raise ValidationError({'error': 'Выбраны повторяющиеся рецепты.'})
+        if set(add_ids) & set(remove_ids):
+            raise ValidationError({
+                'error': 'Рецепт нельзя одновременно добавить и удалить.'
+            })
+        return data
+
+
 class ShoppingCartSerializer(FavoriteSerializer):
 
     class Meta(FavoriteSerializer.Meta):
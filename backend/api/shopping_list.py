@@ -0,0 +1,165 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+from functools import lru_cache
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+
+FONT_NAME = 'FreeSans'
+FONT_PATH = os.path.join(settings.BASE_DIR, 'data', 'FreeSans.ttf')
+FILENAME = 'shopping_cart'
+PDF_RENDER_VERSION = 1
+INDENT = 20
+HEADER_HEIGHT = 800
+FIRST_LINE_HEIGHT = 770
+LINE_HEIGHT = 20
+BOTTOM_MARGIN = 40
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+
+
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def ingredient_line(number, ingredient):
+    return (
+        f'{number}. '
+        f'{ingredient["ingredient__name"]}'
+        f' - {ingredient["amount__sum"]}'
+        f'{ingredient["ingredient__measurement_unit"]}'
+    )
+
+
+def cart_hash(ingredients, export_format):
+    # хэш сводных строк: название и единица измерения входят в выгрузку,
+    # поэтому их изменение тоже меняет ETag
+    return hashlib.sha256(json.dumps(
+        [export_format, PDF_RENDER_VERSION, *ingredients],
+        ensure_ascii=False, sort_keys=True,
+    ).encode()).hexdigest()
+
+
+def draw_pdf(ingredients, file):
+    register_font()
+    pdf = canvas.Canvas(file, pagesize=A4)
+    pdf.setFont(FONT_NAME, 23)
+    pdf.drawString(INDENT, HEADER_HEIGHT, 'Список ингредиентов:')
+    pdf.setFont(FONT_NAME, 15)
+    height_text = FIRST_LINE_HEIGHT
+    for number, ingredient in enumerate(ingredients, 1):
+        if height_text < BOTTOM_MARGIN:
+            pdf.showPage()
+            pdf.setFont(FONT_NAME, 15)
+            height_text = HEADER_HEIGHT
+        pdf.drawString(
+            INDENT, height_text, ingredient_line(number, ingredient)
+        )
+        height_text -= LINE_HEIGHT
+    pdf.showPage()
+    pdf.save()
+
+
+def file_response(file, extension, etag, size):
+    response = FileResponse(
+        file, as_attachment=True, filename=f'{FILENAME}.{extension}',
+    )
+    response['ETag'] = etag
+    response['Content-Length'] = size
+    return response
+
+
+def pdf_response(request, ingredients):
+    ingredients = list(ingredients)
+    digest = cart_hash(ingredients, 'pdf')
+    etag = f'"{digest}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+    key = f'shopping-cart-pdf:{digest}'
+    content = cache.get(key)
+    if content is not None:
+        return file_response(io.BytesIO(content), 'pdf', etag, len(content))
+    # reportlab собирает документ целиком только в save(), поэтому файл
+    # пишется во временный файл и отдается клиенту частями
+    file = tempfile.TemporaryFile()
+    draw_pdf(ingredients, file)
+    size = file.tell()
+    if size <= settings.SHOPPING_LIST_CACHE_MAX_SIZE:
+        file.seek(0)
+        cache.set(key, file.read(), settings.SHOPPING_LIST_CACHE_TIMEOUT)
+    file.seek(0)
+    return file_response(file, 'pdf', etag, size)
+
+
+def text_lines(ingredients):
+    yield 'Список ингредиентов:\n'
+    for number, ingredient in enumerate(ingredients, 1):
+        yield ingredient_line(number, ingredient) + '\n'
+
+
+def csv_lines(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount__sum'],
+        ))
+
+
+def cart_rows(ingredients):
+    return [
+        {
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['amount__sum'],
+        }
+        for ingredient in ingredients
+    ]
+
+
+TEXT_FORMATS = {
+    'txt': (text_lines, 'text/plain; charset=utf-8'),
+    'csv': (csv_lines, 'text/csv; charset=utf-8'),
+}
+
+
+def text_response(request, export_format, ingredients):
+    # сводка занимает по строке на ингредиент и уже прочитана для ETag,
+    # поэтому выгрузка собирается целиком и отдается с Content-Length
+    ingredients = list(ingredients)
+    etag = f'"{cart_hash(ingredients, export_format)}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+    lines, content_type = TEXT_FORMATS[export_format]
+    response = HttpResponse(
+        ''.join(lines(ingredients)).encode(),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{FILENAME}.{export_format}"'
+    )
+    response['Content-Length'] = len(response.content)
+    response['ETag'] = etag
+    return response
@@ -0,0 +1,136 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_save,
+)
+from django.dispatch import receiver
+
+from api.cache import POPULAR_LIST, bump_tags, invalidate_relation_ids
+from api.catalog import INGREDIENTS_CATALOG, TAGS_CATALOG
+from api.recipe_index import log_changes_on_commit
+from api.tag_index import tag_index
+from recipes.models import (
+    Favorite, Ingredient, IngredientRecipe,
+    Recipe, ShoppingCart, Tag, TagRecipe,
+)
+from users.models import Subscription, User
+
+
+def invalidate_on_commit(name, user_id):
+    transaction.on_commit(lambda: invalidate_relation_ids(name, user_id))
+
+
+def bump_tags_on_commit(*tags):
+    transaction.on_commit(lambda: bump_tags(tags))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def favorite_changed(sender, instance, **kwargs):
+    invalidate_on_commit('favorites', instance.user_id)
+    bump_tags_on_commit(POPULAR_LIST)
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    invalidate_on_commit('shopping_cart', instance.user_id)
+
+
+@receiver((post_save, post_delete), sender=Subscription)
+def subscription_changed(sender, instance, **kwargs):
+    invalidate_on_commit('subscriptions', instance.user_id)
+
+
+def tag_slug(tag_id):
+    slugs = {pk: slug for slug, pk in tag_index.get_ids().items()}
+    if tag_id in slugs:
+        return slugs[tag_id]
+    # тег создан в текущей транзакции и еще не попал в справочник
+    return Tag.objects.filter(
+        pk=tag_id
+    ).values_list('slug', flat=True).first()
+
+
+def recipe_tag_scopes(recipe):
+    return [
+        f'list:tag:{slug}' for slug in Tag.objects.filter(
+            tagrecipe__recipe=recipe.pk
+        ).values_list('slug', flat=True)
+    ]
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    # списки по тегам рецепта: новые и удаленные теги сбрасывает
+    # recipe_tags_changed, текущие - здесь
+    tag_scopes = (
+        recipe_tag_scopes(instance)
+        if kwargs['signal'] is post_save and not kwargs['created'] else ()
+    )
+    bump_tags_on_commit(
+        f'recipe:{instance.pk}', 'list', f'list:author:{instance.author_id}',
+        *tag_scopes,
+    )
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def ingredient_recipe_changed(sender, instance, **kwargs):
+    bump_tags_on_commit(f'recipe:{instance.recipe_id}')
+    if kwargs['signal'] is post_delete:
+        delta = -1
+    elif kwargs['created']:
+        delta = 1
+    else:
+        return
+    log_changes_on_commit(
+        ((delta, instance.ingredient_id, instance.recipe_id),)
+    )
+
+
+@receiver((post_save, post_delete), sender=TagRecipe)
+def tag_recipe_changed(sender, instance, **kwargs):
+    # при удалении рецепта списки по его тегам сбрасываются здесь,
+    # по одной связи без запросов к базе
+    slug = tag_slug(instance.tag_id)
+    bump_tags_on_commit(f'recipe:{instance.recipe_id}', f'list:tag:{slug}')
+
+
+@receiver(m2m_changed, sender=TagRecipe)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        bump_tags_on_commit(
+            f'tag:{instance.slug}', f'list:tag:{instance.slug}',
+            *(f'recipe:{pk}' for pk in pk_set or ()),
+        )
+        return
+    tags = Tag.objects.filter(pk__in=pk_set) if pk_set else instance.tags
+    bump_tags_on_commit(
+        f'recipe:{instance.pk}',
+        *(f'list:tag:{slug}' for slug in tags.values_list('slug', flat=True)),
+    )
+
+
+@receiver(pre_save, sender=Tag)
+def tag_renamed(sender, instance, **kwargs):
+    old_slug = Tag.objects.filter(
+        pk=instance.pk
+    ).values_list('slug', flat=True).first()
+    if old_slug and old_slug != instance.slug:
+        bump_tags_on_commit(f'tag:{old_slug}', f'list:tag:{old_slug}')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    bump_tags_on_commit(
+        f'tag:{instance.slug}', f'list:tag:{instance.slug}', TAGS_CATALOG,
+    )
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, **kwargs):
+    bump_tags_on_commit(f'author:{instance.pk}')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    bump_tags_on_commit(INGREDIENTS_CATALOG)
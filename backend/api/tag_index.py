@@ -0,0 +1,35 @@
+from threading import Lock
+
+from api.cache import get_tag_versions
+from api.catalog import TAGS_CATALOG
+from recipes.models import Tag
+
+
+class TagIndex:
+
+    def __init__(self):
+        self.version = None
+        self.ids = {}
+        self.lock = Lock()
+
+    def refresh(self):
+        version = get_tag_versions((TAGS_CATALOG,))[TAGS_CATALOG]
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                # словарь заменяется целиком, читатели не блокируются
+                self.ids = dict(Tag.objects.values_list('slug', 'pk'))
+                self.version = version
+
+    def get_ids(self):
+        """Словарь slug -> id тега актуальной версии справочника."""
+        self.refresh()
+        return self.ids
+
+
+tag_index = TagIndex()
+
+
+def tag_choices():
+    return [(slug, slug) for slug in tag_index.get_ids()]
@@ -0,0 +1,1348 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import mock, skipIf
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Sum
+from django.db.models.signals import post_delete
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.catalog import INGREDIENTS_CATALOG, TAGS_CATALOG
+from api.fields import RecipeImageUploadField
+from api.filters import RECIPE_ORDERINGS, RecipeFilter
+from api.management.commands.benchmark_api import IMAGE
+from api.recipe_index import RECIPE_INDEX, recipe_index
+from api.serializers import recipe_ingredient_links
+from recipes import search
+from recipes.images import generate_variants, variant_name, variant_names
+from recipes.importer import RecipeImporter
+from recipes.models import (
+    Favorite, Ingredient, IngredientRecipe,
+    Recipe, ShoppingCart, Tag, TagRecipe,
+)
+from users.models import Subscription, User
+
+RECIPES = 600
+INGREDIENTS_PER_RECIPE = 3
+# теги - маленький справочник, его полный просмотр дешевле индекса
+SMALL_TABLES = {Tag._meta.db_table}
+
+
+def run_in_other_process(code):
+    # так кэш меняют консольные команды: load_data, import_recipes
+    subprocess.run(
+        (sys.executable, 'manage.py', 'shell', '-c', code),
+        cwd=settings.BASE_DIR, check=True,
+    )
+
+
+def bump_tags_in_other_process(*tags):
+    run_in_other_process(
+        f'from api.cache import bump_tags; bump_tags({tags!r})'
+    )
+
+
+process_local_cache = skipIf(
+    settings.CACHES['default']['BACKEND'].endswith('.LocMemCache'),
+    'кэш в памяти процесса не виден другим процессам',
+)
+
+
+def create_recipes(count, authors, tags, ingredients):
+    Recipe.objects.bulk_create(
+        Recipe(
+            name=f'Рецепт {number}', text='Описание', cooking_time=10,
+            author=authors[number % len(authors)],
+        )
+        for number in range(count)
+    )
+    recipes = list(Recipe.objects.order_by('pk'))
+    IngredientRecipe.objects.bulk_create(
+        IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+        for number, recipe in enumerate(recipes)
+        for ingredient in (
+            ingredients[(number + shift) % len(ingredients)]
+            for shift in range(min(INGREDIENTS_PER_RECIPE, len(ingredients)))
+        )
+    )
+    TagRecipe.objects.bulk_create(
+        TagRecipe(recipe=recipe, tag=tags[number % len(tags)])
+        for number, recipe in enumerate(recipes)
+    )
+    return recipes
+
+
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='reader', email='reader@example.com',
+        )
+        authors = [
+            User.objects.create(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+            )
+            for number in range(5)
+        ]
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}',
+            )
+            for number in range(3)
+        ]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(10)
+        )
+        ingredients = list(Ingredient.objects.order_by('pk'))
+        recipes = create_recipes(RECIPES, authors, tags, ingredients)
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.user, recipe=recipe) for recipe in recipes[::2]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.user, recipe=recipe)
+            for recipe in recipes[::3]
+        )
+        Subscription.objects.create(user=cls.user, author=authors[0])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def assert_list_queries(self, expected):
+        for size in (6, 60, 600):
+            with self.subTest(size=size):
+                cache.clear()
+                with self.assertNumQueries(expected):
+                    response = self.client.get(f'/api/recipes/?limit={size}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), size)
+
+    def test_anonymous_list(self):
+        # count, страница, теги, ингредиенты
+        self.assert_list_queries(4)
+
+    def test_authenticated_list(self):
+        self.client.force_authenticate(self.user)
+        # и по запросу на наборы избранного, корзины и подписок
+        self.assert_list_queries(7)
+
+
+class RecipeListCacheTest(TestCase):
+    """Изменение рецепта сбрасывает кэш списков по его тегам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author', email='author@example.com',
+        )
+        cls.tag = Tag.objects.create(name='Завтрак', color='#000000',
+                                     slug='breakfast')
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        cls.recipe = create_recipes(1, [author], [cls.tag], [ingredient])[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def get_list(self, query):
+        response = self.client.get(f'/api/recipes/?{query}')
+        return response['X-Cache'], response.data['count']
+
+    def test_recipe_update_invalidates_tag_lists(self):
+        query = 'tags=breakfast&cooking_time_max=5'
+        self.assertEqual(self.get_list(query), ('MISS', 0))
+        self.assertEqual(self.get_list(query), ('HIT', 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.cooking_time = 5
+            self.recipe.save()
+        self.assertEqual(self.get_list(query), ('MISS', 1))
+
+    def test_favorite_invalidates_popular_lists(self):
+        reader = User.objects.create(
+            username='reader', email='reader@example.com',
+        )
+        self.assertEqual(self.get_list('ordering=popular'), ('MISS', 1))
+        self.assertEqual(self.get_list('ordering=popular'), ('HIT', 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=reader, recipe=self.recipe)
+        self.assertEqual(self.get_list('ordering=popular'), ('MISS', 1))
+
+    def test_recipe_delete_invalidates_tag_lists(self):
+        self.assertEqual(self.get_list('tags=breakfast'), ('MISS', 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertEqual(self.get_list('tags=breakfast'), ('MISS', 0))
+
+
+class RecipeTagFilterTest(TestCase):
+    """Фильтр по тегам не дублирует рецепты и отклоняет неизвестные
+    теги."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author', email='author@example.com',
+        )
+        lunch = Tag.objects.create(name='Обед', color='#000000',
+                                   slug='lunch')
+        dinner = Tag.objects.create(name='Ужин', color='#ffffff',
+                                    slug='dinner')
+        Tag.objects.create(name='Завтрак', color='#ff0000', slug='breakfast')
+        cls.both, cls.lunch_only = (
+            Recipe.objects.create(
+                name=name, text='Описание', cooking_time=10, author=author,
+            )
+            for name in ('Суп', 'Салат')
+        )
+        cls.both.tags.set((lunch, dinner))
+        cls.lunch_only.tags.set((lunch,))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_distinct(self):
+        for query, expected in (
+            ('tags=lunch&tags=dinner', [self.lunch_only.pk, self.both.pk]),
+            ('tags=dinner', [self.both.pk]),
+            ('tags=breakfast', []),
+        ):
+            with self.subTest(query):
+                response = self.client.get(f'/api/recipes/?{query}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['count'], len(expected))
+                self.assertEqual(
+                    [item['id'] for item in response.json()['results']],
+                    expected,
+                )
+
+    def test_unknown_slug(self):
+        response = self.client.get('/api/recipes/?tags=lunch&tags=brunch')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tags', response.json())
+
+
+class DeleteCountersTest(TestCase):
+    """Каскадное удаление не пересчитывает счетчики по одной связи."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com',
+        )
+        tag = Tag.objects.create(name='Обед', color='#000000', slug='lunch')
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        cls.recipe, cls.other = create_recipes(
+            2, [cls.author], [tag], [ingredient],
+        )
+        cls.readers = [
+            User.objects.create(username=f'reader{number}',
+                                email=f'reader{number}@example.com')
+            for number in range(50)
+        ]
+        for reader in cls.readers:
+            Favorite.objects.create(user=reader, recipe=cls.recipe)
+            ShoppingCart.objects.create(user=reader, recipe=cls.recipe)
+            Favorite.objects.create(user=reader, recipe=cls.other)
+            Subscription.objects.create(user=reader, author=cls.author)
+        Subscription.objects.create(user=cls.author, author=cls.readers[0])
+        User.objects.filter(pk=cls.author.pk).update(recipes_count=2)
+
+    def test_recipe_delete(self):
+        # выборка и удаление связей пакетами, без UPDATE на каждую связь
+        with self.assertNumQueries(11):
+            self.recipe.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+
+    def test_failed_delete(self):
+        def fail(**kwargs):
+            raise DatabaseError('удаление прервано')
+
+        post_delete.connect(fail, sender=Favorite)
+        self.addCleanup(post_delete.disconnect, fail, sender=Favorite)
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            self.recipe.delete()
+        post_delete.disconnect(fail, sender=Favorite)
+        # отметка откаченного удаления не отключает пересчет счетчиков
+        Favorite.objects.get(user=self.readers[0], recipe=self.recipe).delete()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 49)
+
+    def test_user_delete(self):
+        reader = self.readers[1]
+        reader.delete()
+        self.other.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.other.favorites_count, 49)
+        self.assertEqual(self.author.followers_count, 49)
+
+    def test_author_delete(self):
+        self.author.delete()
+        self.readers[0].refresh_from_db()
+        self.assertEqual(self.readers[0].followers_count, 0)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class RecipeCursorPaginationTest(TestCase):
+    """Проход по курсору вперед и назад выдает каждый рецепт ровно один
+    раз в выбранном порядке, в том числе при равных значениях."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author', email='author@example.com',
+        )
+        for number in range(13):
+            Recipe.objects.create(
+                name=f'Рецепт {number}', text='Описание',
+                cooking_time=number % 3 + 1, author=author,
+                favorites_count=number % 2,
+            )
+        # одинаковая дата у половины рецептов: порядок решает id
+        pub_date = Recipe.objects.order_by('pk').first().pub_date
+        Recipe.objects.filter(pk__in=Recipe.objects.order_by(
+            'pk'
+        ).values('pk')[:7]).update(pub_date=pub_date)
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            pages.append(self.client.get(url).json())
+            url = pages[-1][link]
+        return pages
+
+    def ids(self, pages):
+        return [recipe['id'] for page in pages for recipe in page['results']]
+
+    def test_walk(self):
+        for ordering, fields in RECIPE_ORDERINGS.items():
+            with self.subTest(ordering):
+                expected = list(Recipe.objects.order_by(
+                    *fields
+                ).values_list('pk', flat=True))
+                forward = self.walk(
+                    f'/api/recipes/?pagination=cursor&limit=4'
+                    f'&ordering={ordering}', 'next',
+                )
+                self.assertEqual(
+                    [len(page['results']) for page in forward], [4, 4, 4, 1],
+                )
+                self.assertEqual(self.ids(forward), expected)
+                backward = self.walk(forward[-1]['previous'], 'previous')
+                self.assertEqual(self.ids(reversed(backward)), expected[:-1])
+
+
+class SubscriptionListQueriesTest(TestCase):
+    """Подписки читаются тремя запросами при любом recipes_limit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create(
+            username='reader', email='reader@example.com',
+        )
+        for number in range(8):
+            author = User.objects.create(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+            )
+            Subscription.objects.create(user=cls.reader, author=author)
+            for recipe_number in range(5):
+                Recipe.objects.create(
+                    name=f'Рецепт {number}-{recipe_number}',
+                    text='Описание', cooking_time=10, author=author,
+                )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_queries(self):
+        for limit, expected in (('', 5), ('1', 1), ('3', 3), ('10', 5)):
+            with self.subTest(recipes_limit=limit):
+                # COUNT(*), страница авторов и их последние рецепты
+                with self.assertNumQueries(3):
+                    response = self.client.get(
+                        '/api/users/subscriptions/',
+                        {'limit': 6, 'recipes_limit': limit},
+                    )
+                authors = response.json()['results']
+                self.assertEqual(len(authors), 6)
+                for author in authors:
+                    recipes = Recipe.objects.filter(
+                        author_id=author['id'],
+                    ).order_by('-pub_date', '-id')
+                    self.assertEqual(
+                        [recipe['id'] for recipe in author['recipes']],
+                        [recipe.pk for recipe in recipes[:expected]],
+                    )
+
+
+class RecipeIngredientsValidationTest(TestCase):
+    """Повтор ингредиента с другим количеством отклоняется с кодом 400."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com',
+        )
+        cls.tag = Tag.objects.create(name='Ужин', color='#000000',
+                                     slug='dinner')
+        cls.ingredient = Ingredient.objects.create(name='Соль',
+                                                   measurement_unit='г')
+        cls.recipe = create_recipes(
+            1, [cls.author], [cls.tag], [cls.ingredient],
+        )[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def payload(self):
+        return {
+            'name': 'Новый рецепт', 'text': 'Описание', 'cooking_time': 5,
+            'tags': [self.tag.pk], 'image': 'не декодируется',
+            'ingredients': [
+                {'id': self.ingredient.pk, 'amount': 1},
+                {'id': self.ingredient.pk, 'amount': 2},
+            ],
+        }
+
+    def assert_duplicates_rejected(self, response):
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data['ingredients'],
+            ['Выбраны повторяющиеся ингредиенты.'],
+        )
+
+    def test_create(self):
+        self.assert_duplicates_rejected(
+            self.client.post('/api/recipes/', self.payload(), format='json')
+        )
+
+    def test_update(self):
+        payload = self.payload()
+        del payload['image']
+        self.assert_duplicates_rejected(self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/', payload, format='json',
+        ))
+
+    def test_update_keeps_ingredients_ordered_by_name(self):
+        anise = Ingredient.objects.create(name='Анис', measurement_unit='г')
+        apple = Ingredient.objects.create(name='Яблоко',
+                                          measurement_unit='г')
+        payload = self.payload()
+        del payload['image']
+        payload['ingredients'] = [
+            {'id': pk, 'amount': 1}
+            for pk in (anise.pk, self.ingredient.pk, apple.pk)
+        ]
+        url = f'/api/recipes/{self.recipe.pk}/'
+        for response in (
+            self.client.patch(url, payload, format='json'),
+            self.client.get(url),
+        ):
+            self.assertEqual(
+                [item['name'] for item in response.data['ingredients']],
+                ['Яблоко', 'Соль', 'Анис'],
+            )
+
+
+class RecipeWriteQueriesTest(TestCase):
+    """Число запросов записи рецепта с 30 ингредиентами; с пустым кэшем
+    добавляются наборы id подписок, избранного и списка покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com',
+        )
+        cls.tag_ids = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag-{number}',
+            ).pk
+            for number in range(2)
+        ]
+        cls.ingredient_ids = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г',
+            ).pk
+            for number in range(30)
+        ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=directory.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def payload(self, name):
+        return {
+            'name': name, 'text': 'Описание', 'cooking_time': 5,
+            'image': IMAGE, 'tags': self.tag_ids,
+            'ingredients': [
+                {'id': pk, 'amount': 10} for pk in self.ingredient_ids
+            ],
+        }
+
+    def create(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/', self.payload(name), format='json',
+            )
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def update(self, pk, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{pk}/', self.payload(name), format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_create(self):
+        with self.assertNumQueries(17):
+            self.create('Холодный кэш')
+        with self.assertNumQueries(14):
+            self.create('Теплый кэш')
+
+    def test_update(self):
+        pk = self.create('Рецепт')
+        cache.clear()
+        # на 1 запрос больше создания: имя старой картинки
+        with self.assertNumQueries(18):
+            self.update(pk, 'Холодный кэш')
+        with self.assertNumQueries(15):
+            self.update(pk, 'Теплый кэш')
+
+
+class RecipeMultipartTest(TestCase):
+    """Рецепт создается и изменяется через multipart/form-data, а
+    изображение декодируется только после проверки остальных полей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com',
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag-{number}',
+            )
+            for number in range(2)
+        ]
+        cls.salt, cls.sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Сахар')
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=directory.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+        return ContentFile(buffer.getvalue(), name='photo.png')
+
+    def payload(self, name, *ingredients):
+        return {
+            'name': name, 'text': 'Описание', 'cooking_time': 5,
+            'image': self.image(),
+            'tags': [tag.pk for tag in self.tags],
+            'ingredients': json.dumps([
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in ingredients
+            ]),
+        }
+
+    def test_create_and_update(self):
+        response = self.client.post('/api/recipes/', self.payload(
+            'Суп', (self.salt, 5),
+        ), format='multipart')
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        old_image = recipe.image.name
+        self.assertEqual(
+            sorted(recipe.tags.values_list('slug', flat=True)),
+            ['tag-0', 'tag-1'],
+        )
+        payload = self.payload('Сладкий суп', (self.sugar, 10))
+        payload['tags'] = json.dumps([self.tags[0].pk])
+        response = self.client.patch(
+            f'/api/recipes/{recipe.pk}/', payload, format='multipart',
+        )
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Сладкий суп')
+        self.assertNotEqual(recipe.image.name, old_image)
+        self.assertEqual(list(recipe.tags.all()), [self.tags[0]])
+        self.assertEqual(
+            list(recipe.ingredientrecipe_set.values_list(
+                'ingredient__name', 'amount',
+            )),
+            [('Сахар', 10)],
+        )
+
+    def test_image_decoded_after_cheap_validation(self):
+        with mock.patch.object(
+            RecipeImageUploadField, 'decode', autospec=True,
+            side_effect=RecipeImageUploadField.decode,
+        ) as decode:
+            for ingredients, status_code, decoded in (
+                (((self.salt, 1), (self.salt, 2)), 400, False),
+                (((self.salt, 0),), 400, False),
+                (((self.salt, 1),), 201, True),
+            ):
+                with self.subTest(ingredients=ingredients):
+                    decode.reset_mock()
+                    response = self.client.post(
+                        '/api/recipes/',
+                        self.payload(f'Суп {status_code}', *ingredients),
+                        format='multipart',
+                    )
+                    self.assertEqual(response.status_code, status_code)
+                    self.assertEqual(decode.called, decoded)
+
+
+class QueryPlansTest(TestCase):
+    """Частые запросы API используют индексы.
+
+    Полный просмотр таблицы или сортировка, которой не должно быть,
+    в плане запроса считаются ошибкой.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='reader', email='reader@example.com',
+        )
+        cls.authors = [
+            User.objects.create(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+            )
+            for number in range(3)
+        ]
+        cls.tag = Tag.objects.create(name='Обед', color='#000000',
+                                     slug='lunch')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(5)
+        )
+        cls.recipes = create_recipes(
+            30, cls.authors, [cls.tag],
+            list(Ingredient.objects.order_by('pk')),
+        )
+        for recipe in cls.recipes[::2]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        for author in cls.authors:
+            Subscription.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            self.skipTest(f'Query plans are not checked for '
+                          f'{connection.vendor}.')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # на маленькой тестовой базе полный просмотр и сортировка
+                # дешевле индекса; запрет оставляет их в плане только там,
+                # где подходящего индекса нет
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_sort = off')
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sqlite_problems(self, cursor, sql, params, allow_sort):
+        problems = []
+        # просмотр подзапроса (SCAN latest) - не просмотр таблицы
+        tables = set(connection.introspection.table_names(cursor))
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        for *_, detail in cursor.fetchall():
+            words = detail.split()
+            if (
+                words[0] == 'SCAN' and 'INDEX' not in words
+                and words[1] in tables - SMALL_TABLES
+            ):
+                problems.append(detail)
+            if 'TEMP B-TREE' in detail and not allow_sort:
+                problems.append(detail)
+        return problems
+
+    def postgresql_problems(self, cursor, sql, params, allow_sort):
+        problems = []
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes = [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.get('Plans', ()))
+            if (
+                node['Node Type'] == 'Seq Scan'
+                and node['Relation Name'] not in SMALL_TABLES
+            ):
+                problems.append(f'Seq Scan on {node["Relation Name"]}')
+            if (
+                node['Node Type'] in ('Sort', 'Incremental Sort')
+                and not allow_sort
+            ):
+                problems.append(
+                    f'{node["Node Type"]} by {", ".join(node["Sort Key"])}'
+                )
+        return problems
+
+    def assert_plan(self, query, allow_sort=False):
+        """query - queryset или готовый SQL из CaptureQueriesContext."""
+        if isinstance(query, str):
+            sql, params = query, None
+        else:
+            sql, params = query.query.sql_with_params()
+        get_problems = getattr(self, f'{connection.vendor}_problems')
+        with connection.cursor() as cursor:
+            problems = get_problems(cursor, sql, params, allow_sort)
+        self.assertEqual(problems, [], sql)
+
+    def endpoint_queries(self, url, marker):
+        """SQL-запросы эндпоинта, содержащие marker."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        queries = [
+            query['sql'] for query in context.captured_queries
+            if marker in query['sql']
+        ]
+        self.assertTrue(queries, f'{url}: no queries with {marker}')
+        return queries
+
+    def recipe_list(self, query):
+        return RecipeFilter(
+            QueryDict(query), queryset=Recipe.objects.all()
+        ).qs
+
+    def checks(self):
+        """Пары (название, queryset, допустима ли сортировка)."""
+        user, recipe = self.user, self.recipes[0]
+        for ordering in RECIPE_ORDERINGS:
+            yield (f'recipes_{ordering}',
+                   self.recipe_list(f'ordering={ordering}')[:6], False)
+            yield (f'recipes_{ordering}_tags',
+                   self.recipe_list(
+                       f'ordering={ordering}&tags={self.tag.slug}'
+                   )[:6], False)
+        # релевантность вычисляется для найденных рецептов и сортируется
+        yield ('recipes_search', self.recipe_list('search=суп')[:6], True)
+        yield ('recipes_author',
+               self.recipe_list(f'author={recipe.author_id}')[:6], False)
+        # избранное и корзина одного пользователя невелики,
+        # их сортировка в памяти допустима, но не полный просмотр
+        yield ('recipes_favorited',
+               Recipe.objects.filter(favorites__user=user)[:6], True)
+        yield ('recipes_in_shopping_cart',
+               Recipe.objects.filter(shopping_cart__user=user)[:6], True)
+        for model in (Favorite, ShoppingCart):
+            yield (f'{model._meta.model_name}_ids',
+                   model.objects.filter(user=user).order_by().values_list(
+                       'recipe_id', flat=True
+                   ), False)
+        yield ('recipe_ingredients',
+               recipe_ingredient_links().filter(recipe=recipe), True)
+        yield ('recipe_index_build',
+               IngredientRecipe.objects.order_by(
+                   'ingredient_id', 'recipe_id'
+               ).values_list('ingredient_id', 'recipe_id'), False)
+        yield ('shopping_cart_totals',
+               IngredientRecipe.objects.filter(
+                   recipe__shopping_cart__user=user
+               ).values(
+                   'ingredient__name', 'ingredient__measurement_unit'
+               ).annotate(Sum('amount')).order_by('ingredient'), True)
+        # подписки сортируются в пределах одного пользователя
+        yield ('subscriptions',
+               User.objects.filter(
+                   subscription__user=user
+               ).order_by('username')[:6], True)
+
+    def test_hot_querysets(self):
+        for name, queryset, allow_sort in self.checks():
+            with self.subTest(name):
+                self.assert_plan(queryset, allow_sort)
+
+    def test_recipe_list_count(self):
+        # COUNT(*) пагинатора выполняется для каждой страницы списка
+        for query in (
+            '', f'tags={self.tag.slug}', 'ordering=popular',
+            f'author={self.authors[0].pk}&tags={self.tag.slug}',
+        ):
+            with self.subTest(query):
+                for sql in self.endpoint_queries(
+                    f'/api/recipes/?{query}', 'COUNT(*)'
+                ):
+                    self.assert_plan(sql)
+
+    def test_subscriptions_latest_recipes(self):
+        # последние рецепты сортируются в пределах авторов одной страницы
+        for sql in self.endpoint_queries(
+            '/api/users/subscriptions/?recipes_limit=3', 'ROW_NUMBER'
+        ):
+            self.assert_plan(sql, allow_sort=True)
+
+
+class ShoppingCartDownloadTest(TestCase):
+    """ETag списка покупок меняется вместе с содержимым выгрузки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='reader', email='reader@example.com',
+        )
+        tag = Tag.objects.create(name='Обед', color='#000000', slug='lunch')
+        cls.ingredient = Ingredient.objects.create(name='Соль',
+                                                   measurement_unit='г')
+        recipe = create_recipes(1, [cls.user], [tag], [cls.ingredient])[0]
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, export_format, **headers):
+        return self.client.get(
+            '/api/recipes/download_shopping_cart/',
+            {'format': export_format}, **headers,
+        )
+
+    def test_renamed_ingredient_changes_etag(self):
+        for export_format in ('txt', 'csv', 'pdf'):
+            with self.subTest(export_format):
+                self.ingredient.name = 'Соль'
+                self.ingredient.save()
+                etag = self.download(export_format)['ETag']
+                self.assertEqual(
+                    self.download(
+                        export_format, HTTP_IF_NONE_MATCH=etag,
+                    ).status_code, 304,
+                )
+                self.ingredient.name = 'Морская соль'
+                self.ingredient.save()
+                response = self.download(
+                    export_format, HTTP_IF_NONE_MATCH=etag,
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_formats_have_distinct_etags(self):
+        etags = {
+            self.download(export_format)['ETag']
+            for export_format in ('txt', 'csv', 'pdf')
+        }
+        self.assertEqual(len(etags), 3)
+
+    def test_text_formats(self):
+        for export_format, content in (
+            ('txt', 'Список ингредиентов:\n1. Соль - 1г\n'),
+            ('csv', 'name,measurement_unit,amount\r\nСоль,г,1\r\n'),
+        ):
+            with self.subTest(export_format):
+                response = self.download(export_format)
+                self.assertFalse(response.streaming)
+                self.assertEqual(response.content.decode(), content)
+                self.assertEqual(int(response['Content-Length']),
+                                 len(response.content))
+
+    def test_json(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/',
+            HTTP_ACCEPT='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {'name': 'Соль', 'measurement_unit': 'г', 'amount': 1},
+        ])
+
+    def test_errors_are_json(self):
+        for headers, status_code in (
+            ({'HTTP_ACCEPT': 'image/png'}, 406),
+            ({'HTTP_ACCEPT': 'application/pdf'}, 401),
+        ):
+            with self.subTest(status_code):
+                if status_code == 401:
+                    self.client.force_authenticate(None)
+                response = self.client.get(
+                    '/api/recipes/download_shopping_cart/', **headers,
+                )
+                self.assertEqual(response.status_code, status_code)
+                self.assertEqual(response['Content-Type'],
+                                 'application/json')
+                self.assertIn('detail', response.json())
+
+
+class RelationBatchTest(TestCase):
+    """Счетчики и статусы набора следуют строкам, измененным базой."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='reader', email='reader@example.com',
+        )
+        tag = Tag.objects.create(name='Обед', color='#000000', slug='lunch')
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        cls.recipes = create_recipes(3, [cls.user], [tag], [ingredient])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_batch(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        # строка уже добавлена, например параллельным запросом
+        Favorite.objects.create(user=self.user, recipe_id=first)
+        response = self.client.post('/api/recipes/favorite/batch/', {
+            'add': [first, second, 10 ** 6], 'remove': [third],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['already_added', 'added', 'not_found', 'not_added'],
+        )
+        self.assertEqual(
+            dict(Recipe.objects.values_list('pk', 'favorites_count')),
+            {first: 1, second: 1, third: 0},
+        )
+        response = self.client.post('/api/recipes/favorite/batch/', {
+            'remove': [first, second, third],
+        }, format='json')
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['removed', 'removed', 'not_added'],
+        )
+        self.assertEqual(
+            dict(Recipe.objects.values_list('pk', 'favorites_count')),
+            {first: 0, second: 0, third: 0},
+        )
+
+
+class RecipeImporterConflictTest(TestCase):
+    """Рецепт, появившийся после проверки, отклоняется без ошибки 500."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='partner', email='partner@example.com',
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#000000',
+                                     slug='lunch')
+        cls.ingredient = Ingredient.objects.create(name='Соль',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = os.path.join(directory.name, 'media')
+        self.image_dir = os.path.join(directory.name, 'images')
+        os.makedirs(self.image_dir)
+        Image.new('RGB', (4, 4)).save(
+            os.path.join(self.image_dir, 'soup.png')
+        )
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def record(self, name):
+        return {
+            'name': name, 'text': 'Описание', 'cooking_time': 10,
+            'tags': [self.tag.pk], 'ingredients': {self.ingredient.pk: 1},
+            'image': os.path.join(self.image_dir, 'soup.png'),
+            'author': self.author,
+        }
+
+    def test_conflict_is_reported(self):
+        importer = RecipeImporter(author=self.author,
+                                  image_dir=self.image_dir)
+        # запись, прошедшая проверку, и параллельно созданный рецепт
+        Recipe.objects.create(name='Суп', text='Описание', cooking_time=5,
+                              author=self.author)
+        errors = list(importer._save_batch([
+            (1, self.record('Суп')), (2, self.record('Борщ')),
+        ]))
+        self.assertEqual(errors, [{'line': 1, 'errors': {
+            'name, author': 'Данный рецепт опубликован ранее.',
+        }}])
+        self.assertEqual((importer.created, importer.failed), (1, 1))
+        borsch = Recipe.objects.get(name='Борщ')
+        # файлы откаченных попыток удалены, остался только файл Борща
+        images = os.listdir(os.path.join(self.media_root, 'recipes'))
+        self.assertEqual(images, [os.path.basename(borsch.image.name)])
+
+
+class CatalogSnapshotTest(TestCase):
+    """Сжатый и несжатый снимок справочника имеют разные ETag."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Обед', color='#000000', slug='lunch')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_gzip_etag(self):
+        identity = self.client.get('/api/tags/')
+        compressed = self.client.get('/api/tags/',
+                                     HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(compressed['ETag'],
+                         identity['ETag'][:-1] + '-gzip"')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        for response, headers, status_code in (
+            (compressed, {'HTTP_ACCEPT_ENCODING': 'gzip'}, 304),
+            (compressed, {}, 200),
+            (identity, {}, 304),
+        ):
+            with self.subTest(etag=response['ETag'], headers=headers):
+                self.assertEqual(self.client.get(
+                    '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag'],
+                    **headers,
+                ).status_code, status_code)
+
+
+class RecipeSearchTest(TestCase):
+    """Полнотекстовый поиск рецептов по наименованию и описанию."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author', email='author@example.com',
+        )
+        Recipe.objects.bulk_create(
+            Recipe(name=name, text=text, cooking_time=10, author=author)
+            for name, text in (
+                ('Салат', 'Подавать с гренками к супу'),
+                ('Суп гороховый', 'Варить до готовности'),
+                ('Омлет', 'Взбить яйца'),
+            )
+        )
+        # bulk_create минует сигналы, индекс поиска заполняется целиком
+        search.index_recipes()
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_name_match_ranks_first(self):
+        self.assertEqual(self.search('суп'), ['Суп гороховый', 'Салат'])
+
+    def test_quoted_query(self):
+        self.assertEqual(self.search('"суп гороховый"'), ['Суп гороховый'])
+
+    def test_query_without_words(self):
+        for query in ('"', '!!', '*'):
+            with self.subTest(query):
+                self.assertEqual(self.search(query), [])
+                response = self.client.get('/api/recipes/', {
+                    'search': query, 'pagination': 'cursor',
+                })
+                self.assertEqual(response.status_code, 200)
+
+    def test_backend_by_vendor(self):
+        queryset = Recipe.objects.all()
+        for vendor, function in (
+            ('postgresql', 'postgresql_search'),
+            ('sqlite', 'sqlite_search'),
+        ):
+            with self.subTest(vendor), mock.patch.object(
+                search, 'connection', mock.Mock(vendor=vendor),
+            ), mock.patch.object(search, function) as backend:
+                search.search_recipes(queryset, 'суп')
+                backend.assert_called_once_with(queryset, 'суп')
+        with mock.patch.object(
+            search, 'connection', mock.Mock(vendor='mysql'),
+        ):
+            # прочие базы ищут подстроку без ранжирования
+            self.assertEqual(list(search.search_recipes(
+                queryset, 'мле'
+            ).values_list('name', flat=True)), ['Омлет'])
+
+
+class RecipeImageVariantsTest(TestCase):
+    """Уменьшенные копии не пересекаются и удаляются вместе с оригиналом."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=directory.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.author = User.objects.create(
+            username='author', email='author@example.com',
+        )
+
+    def image(self, name):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+        return ContentFile(buffer.getvalue(), name=name)
+
+    def create_recipe(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                name=name, text='Описание', cooking_time=10,
+                author=self.author, image=self.image('photo.png'),
+            )
+        generate_variants(recipe.image.name)
+        return recipe
+
+    def assert_variants_exist(self, name, exist):
+        for path in variant_names(name):
+            self.assertEqual(default_storage.exists(path), exist, path)
+
+    def test_names_keep_extension(self):
+        self.assertNotEqual(
+            variant_name('recipes/photo.jpg', 'thumbnail'),
+            variant_name('recipes/photo.png', 'thumbnail'),
+        )
+
+    def test_replaced_image(self):
+        recipe = self.create_recipe('Суп')
+        old_name = recipe.image.name
+        self.assert_variants_exist(old_name, True)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.image = self.image('photo.png')
+            recipe.save()
+        self.assert_variants_exist(old_name, False)
+        self.assertFalse(recipe.image_variants_ready)
+
+    def test_deleted_recipe(self):
+        recipe = self.create_recipe('Суп')
+        name = recipe.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assert_variants_exist(name, False)
+
+
+class RecipeIngredientIndexTest(TestCase):
+    """Фильтры рецептов по ингредиентам через индекс в памяти."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author', email='author@example.com',
+        )
+        cls.ingredients = {
+            name: Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in 'abcd'
+        }
+        cls.recipes = {}
+        for name, ingredients in (('ab', 'ab'), ('ac', 'ac'),
+                                  ('abcd', 'abcd')):
+            recipe = cls.recipes[name] = Recipe.objects.create(
+                name=name, text='Описание', cooking_time=10, author=author,
+            )
+            for ingredient in ingredients:
+                IngredientRecipe.objects.create(
+                    recipe=recipe, ingredient=cls.ingredients[ingredient],
+                    amount=1,
+                )
+
+    def setUp(self):
+        cache.clear()
+
+    def ids(self, names):
+        return ','.join(str(self.ingredients[name].pk) for name in names)
+
+    def found(self, **params):
+        response = self.client.get('/api/recipes/', {
+            name: self.ids(value) if name.endswith('ingredients') else value
+            for name, value in params.items()
+        })
+        self.assertEqual(response.status_code, 200)
+        return {item['name'] for item in response.json()['results']}
+
+    def test_filters(self):
+        for params, names in (
+            ({'ingredients': 'ab'}, {'ab', 'abcd'}),
+            ({'any_ingredients': 'bc'}, {'ab', 'ac', 'abcd'}),
+            ({'exclude_ingredients': 'c'}, {'ab'}),
+            ({'ingredients': 'a', 'exclude_ingredients': 'd'}, {'ab', 'ac'}),
+            ({'ingredients': 'ab', 'max_missing': 0}, {'ab'}),
+            ({'ingredients': 'abc', 'max_missing': 0}, {'ab', 'ac'}),
+            ({'ingredients': 'abc', 'max_missing': 1}, {'ab', 'ac', 'abcd'}),
+        ):
+            with self.subTest(**params):
+                self.assertEqual(self.found(**params), names)
+
+    def test_changes_after_bump(self):
+        self.assertEqual(self.found(ingredients='d'), {'abcd'})
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientRecipe.objects.create(
+                recipe=self.recipes['ab'], ingredient=self.ingredients['d'],
+                amount=1,
+            )
+            IngredientRecipe.objects.filter(
+                recipe=self.recipes['abcd'], ingredient=self.ingredients['d'],
+            ).delete()
+        self.assertEqual(self.found(ingredients='d'), {'ab'})
+        self.assertEqual(self.found(ingredients='abd', max_missing=0),
+                         {'ab'})
+
+    def test_snapshot_not_changed(self):
+        recipe_index.select((self.ingredients['d'].pk,))
+        postings, sizes = recipe_index.postings, recipe_index.sizes
+        recipes = postings[self.ingredients['d'].pk]
+        before = (recipes.tolist(), sizes.tolist())
+        recipe_index.apply((
+            (1, self.ingredients['d'].pk, self.recipes['ac'].pk),
+        ))
+        self.assertEqual((recipes.tolist(), sizes.tolist()), before)
+        self.assertIsNot(recipe_index.postings, postings)
+
+
+@process_local_cache
+class CrossProcessVersionsTest(TestCase):
+    """Индексы и снимки видят версии, измененные другим процессом."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_ingredient_index(self):
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+        self.assertEqual(
+            len(self.client.get('/api/ingredients/?name=сах').json()), 0,
+        )
+        # без сигналов, как при загрузке справочника из другого процесса
+        Ingredient.objects.bulk_create((
+            Ingredient(name='Сахар', measurement_unit='г'),
+        ))
+        bump_tags_in_other_process(INGREDIENTS_CATALOG)
+        self.assertEqual(
+            [item['name'] for item in self.client.get(
+                '/api/ingredients/?name=сах').json()],
+            ['Сахар'],
+        )
+
+    def test_tag_index(self):
+        author = User.objects.create(
+            username='author', email='author@example.com',
+        )
+        Tag.objects.create(name='Обед', color='#000000', slug='lunch')
+        self.assertEqual(
+            self.client.get('/api/recipes/?tags=dinner').status_code, 400,
+        )
+        Tag.objects.bulk_create((
+            Tag(name='Ужин', color='#ffffff', slug='dinner'),
+        ))
+        recipe = Recipe.objects.create(
+            name='Суп', text='Описание', cooking_time=10, author=author,
+        )
+        TagRecipe.objects.bulk_create((
+            TagRecipe(recipe=recipe, tag=Tag.objects.get(slug='dinner')),
+        ))
+        bump_tags_in_other_process(TAGS_CATALOG)
+        response = self.client.get('/api/recipes/?tags=dinner')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['id'] for item in response.json()['results']],
+            [recipe.pk],
+        )
+
+    def recipe_with_link(self):
+        author = User.objects.create(
+            username='author', email='author@example.com',
+        )
+        Ingredient.objects.bulk_create((
+            Ingredient(name='Соль', measurement_unit='г'),
+            Ingredient(name='Сахар', measurement_unit='г'),
+        ))
+        sugar, salt = Ingredient.objects.order_by('name')
+        recipe = Recipe.objects.create(
+            name='Суп', text='Описание', cooking_time=10, author=author,
+        )
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=salt, amount=1,
+        )
+        url = f'/api/recipes/?ingredients={salt.pk}'
+        self.assertEqual(len(self.client.get(url).json()['results']), 1)
+        # связь без сигналов, как при импорте в другом процессе
+        IngredientRecipe.objects.bulk_create((
+            IngredientRecipe(recipe=recipe, ingredient=sugar, amount=1),
+        ))
+        return recipe, sugar
+
+    def test_recipe_index_rebuilt(self):
+        recipe, sugar = self.recipe_with_link()
+        url = f'/api/recipes/?ingredients={sugar.pk}'
+        self.assertEqual(len(self.client.get(url).json()['results']), 0)
+        bump_tags_in_other_process(RECIPE_INDEX)
+        self.assertEqual(
+            [item['id'] for item in self.client.get(url).json()['results']],
+            [recipe.pk],
+        )
+
+    def test_recipe_index_changes(self):
+        recipe, sugar = self.recipe_with_link()
+        run_in_other_process(
+            'from api.recipe_index import log_changes; '
+            f'log_changes(((1, {sugar.pk}, {recipe.pk}),))'
+        )
+        url = f'/api/recipes/?ingredients={sugar.pk}'
+        self.assertEqual(
+            [item['id'] for item in self.client.get(url).json()['results']],
+            [recipe.pk],
+        )
+
+    def test_catalog_snapshot(self):
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+        old = self.client.get('/api/ingredients/')
+        Ingredient.objects.bulk_create((
+            Ingredient(name='Сахар', measurement_unit='г'),
+        ))
+        bump_tags_in_other_process(INGREDIENTS_CATALOG)
+        response = self.client.get(
+            '/api/ingredients/', HTTP_IF_NONE_MATCH=old['ETag'],
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], old['ETag'])
+        self.assertEqual(
+            sorted(item['name'] for item in response.json()),
+            ['Сахар', 'Соль'],
+        )
@@ -1,30 +1,48 @@
-import io
+import json
+import tempfile
+from collections import defaultdict
 
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
-
-from django.db.models import Sum
+from django.db.models import BooleanField, F, Prefetch, Sum, Value, Window
+from django.db.models.functions import RowNumber
 from django.http import FileResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.generics import ListAPIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from api.filters import IngredientSearchFilter, RecipeFilter
-from api.paginations import LimitCustomPagination
+from api.cache import (
+    POPULAR_LIST, cache_response_data, get_cached_response_data,
+    response_cache_key, response_cache_stats,
+)
+from api.catalog import (
+    INGREDIENTS_CATALOG, TAGS_CATALOG, snapshot_response,
+)
+from api.filters import INGREDIENT_FILTERS, RecipeFilter
+from api.ingredient_index import ingredient_index
+from api.paginations import (
+    LimitCursorPagination, LimitCustomPagination,
+    SubscriptionCursorPagination,
+)
 from api.permissons import IsAuthorOrAdminOrReadOnly
+from api.recipe_index import RECIPE_INDEX
+from api.relations import apply_relation_batch
+from api.renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
 from api.serializers import (
     IngredientSerializer, FavoriteSerializer,
-    RecipeListSerializer, RecipeSerializer,
+    RecipeDetailSerializer, RecipeListSerializer, RecipeSerializer,
+    RelationBatchSerializer,
+    recipe_ingredient_links,
     ShoppingCartSerializer, SubscriptionListSerializer,
     SubscriptionSerializer, TagSerializer,
 )
+from api.shopping_list import cart_rows, pdf_response, text_response
+from recipes.importer import RecipeImporter
 from recipes.models import (
     Favorite, Ingredient,
     IngredientRecipe, Recipe,
@@ -33,30 +51,160 @@ from recipes.models import (
 from users.models import Subscription, User
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class CatalogSnapshotMixin:
+    catalog = None
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        return snapshot_response(
+            request,
+            self.catalog,
+            lambda: self.get_serializer(self.get_queryset(), many=True).data,
+        )
+
+
+class TagViewSet(CatalogSnapshotMixin, ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    catalog = TAGS_CATALOG
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogSnapshotMixin, ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
+    catalog = INGREDIENTS_CATALOG
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
+
+class AnonymousResponseCacheMixin:
 
+    def get_cache_scope_tags(self, request):
+        return ()
 
-class RecipeViewSet(ModelViewSet):
+    def get_cache_content_tags(self, data):
+        return ()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        key = response_cache_key(request)
+        data = get_cached_response_data(key)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache_response_data(key, response.data, (
+                *self.get_cache_scope_tags(request),
+                *self.get_cache_content_tags(response.data),
+            ))
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class CursorPaginationMixin:
+    cursor_pagination_class = None
+
+    # постраничная навигация по курсору включается параметром
+    # ?pagination=cursor, ссылки next/previous содержат ?cursor=
+    def use_cursor_pagination(self):
+        params = self.request.query_params
+        return (params.get('pagination') == 'cursor'
+                or 'cursor' in params)
+
+    @property
+    def paginator(self):
+        if (not hasattr(self, '_paginator')
+                and self.use_cursor_pagination()):
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
+
+
+class RecipeViewSet(
+    AnonymousResponseCacheMixin, CursorPaginationMixin, ModelViewSet
+):
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     pagination_class = LimitCustomPagination
+    cursor_pagination_class = LimitCursorPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method != 'GET':
+            return queryset
+        return queryset.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredientrecipe_set', queryset=recipe_ingredient_links(),
+            ),
+        )
+
     def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return RecipeDetailSerializer
         if self.request.method == 'GET':
             return RecipeListSerializer
         return RecipeSerializer
 
+    def get_cache_scope_tags(self, request):
+        if self.action != 'list':
+            return ()
+        shared = (
+            (POPULAR_LIST,)
+            if request.query_params.get('ordering') == 'popular' else ()
+        )
+        # состав выборки по ингредиентам меняется вместе со связями
+        # рецептов, которые не сбрасывают списки
+        if any(request.query_params.get(name) for name in INGREDIENT_FILTERS):
+            shared += (RECIPE_INDEX,)
+        author = request.query_params.get('author')
+        if author:
+            return (f'list:author:{author}', *shared)
+        slugs = request.query_params.getlist('tags')
+        if slugs:
+            return (*(f'list:tag:{slug}' for slug in slugs), *shared)
+        return ('list', *shared)
+
+    def get_cache_content_tags(self, data):
+        recipes = data.get('results', ()) if self.action == 'list' else (data,)
+        tags = set()
+        for recipe in recipes:
+            tags.add(f'recipe:{recipe["id"]}')
+            tags.add(f'author:{recipe["author"]["id"]}')
+            tags.update(f'tag:{tag["slug"]}' for tag in recipe['tags'])
+        return tags
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # ошибки выгрузки списка покупок (401, 406) отдаются в JSON,
+        # а не в формате файла, выбранном по заголовку Accept
+        if (
+            self.action == 'download_shopping_cart'
+            and isinstance(response, Response)
+            and response.status_code >= status.HTTP_400_BAD_REQUEST
+        ):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    @action(detail=False, permission_classes=(IsAdminUser,))
+    def cache_stats(self, request):
+        return Response(response_cache_stats())
+
     @staticmethod
     def post_method_for_favorite_shoppingcart(serializer, request, pk):
         serializer = serializer(
@@ -74,6 +222,17 @@ class RecipeViewSet(ModelViewSet):
         ).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @staticmethod
+    def batch_method_for_favorite_shoppingcart(model, request):
+        serializer = RelationBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = apply_relation_batch(
+            model, request.user,
+            serializer.validated_data['add'],
+            serializer.validated_data['remove'],
+        )
+        return Response({'results': results})
+
     @action(methods=['post'], detail=True)
     def favorite(self, request, pk):
         return self.post_method_for_favorite_shoppingcart(
@@ -86,6 +245,13 @@ class RecipeViewSet(ModelViewSet):
             Favorite, request, pk,
         )
 
+    @action(
+        methods=['post'], detail=False, url_path='favorite/batch',
+        permission_classes=(IsAuthenticated,),
+    )
+    def favorite_batch(self, request):
+        return self.batch_method_for_favorite_shoppingcart(Favorite, request)
+
     @action(methods=['post'], detail=True)
     def shopping_cart(self, request, pk):
         return self.post_method_for_favorite_shoppingcart(
@@ -98,54 +264,101 @@ class RecipeViewSet(ModelViewSet):
             ShoppingCart, request, pk,
         )
 
-    @staticmethod
-    def create_pdf_file(ingredients):
-        INDENT = 20
-        HEADER_HEIGHT = 800
-        height_text = 770
-        number = 1
-        pdfmetrics.registerFont(TTFont('FreeSans', 'data/FreeSans.ttf'))
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer)
-        p.setFont('FreeSans', 23)
-        p.drawString(INDENT, HEADER_HEIGHT, 'Список ингредиентов:')
-        p.setFont('FreeSans', 15)
-        for ingredient in ingredients:
-            p.drawString(
-                INDENT,
-                height_text,
-                f'{number}. '
-                f'{ingredient["ingredient__name"]}'
-                f' - {ingredient["amount__sum"]}'
-                f'{ingredient["ingredient__measurement_unit"]}'
-            )
-            height_text -= 20
-            number += 1
-        p.showPage()
-        p.save()
-        buffer.seek(0)
-        return FileResponse(
-            buffer, as_attachment=True, filename='shopping_cart.pdf'
+    @action(
+        methods=['post'], detail=False, url_path='shopping_cart/batch',
+        permission_classes=(IsAuthenticated,),
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch_method_for_favorite_shoppingcart(
+            ShoppingCart, request,
         )
 
-    @action(detail=False, permission_classes=(IsAuthenticated,))
-    def download_shopping_cart(self, request):
+    @action(
+        methods=['post'], detail=False, url_path='import',
+        permission_classes=(IsAdminUser,),
+    )
+    def import_recipes(self, request):
+        # тело запроса в NDJSON читается построчно, а отчет об ошибках
+        # пишется во временный файл, поэтому память не зависит от объема
+        if request.stream is None:
+            return Response(
+                {'error': 'Передайте рецепты в формате NDJSON.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        importer = RecipeImporter(author=request.user)
+        report = tempfile.TemporaryFile()
+        for error in importer.run(request.stream):
+            report.write(
+                json.dumps(error, ensure_ascii=False).encode() + b'\n'
+            )
+        report.write(json.dumps({
+            'created': importer.created, 'failed': importer.failed,
+        }).encode() + b'\n')
+        report.seek(0)
+        return FileResponse(report, content_type='application/x-ndjson')
 
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            PDFRenderer, PlainTextRenderer, CSVRenderer, JSONRenderer,
+        ),
+    )
+    def download_shopping_cart(self, request):
         ingredients = IngredientRecipe.objects.filter(
             recipe__shopping_cart__user=request.user
         ).values(
             'ingredient__name', 'ingredient__measurement_unit'
         ).annotate(Sum('amount')).order_by('ingredient')
-        return self.create_pdf_file(ingredients)
+        export_format = request.accepted_renderer.format
+        if export_format == 'pdf':
+            return pdf_response(request, ingredients)
+        if export_format == 'json':
+            return Response(cart_rows(ingredients))
+        return text_response(request, export_format, ingredients)
 
 
-class APISubscriptionList(ListAPIView):
+class APISubscriptionList(CursorPaginationMixin, ListAPIView):
     serializer_class = SubscriptionListSerializer
     permission_classes = (IsAuthenticated,)
     pagination_class = LimitCustomPagination
+    cursor_pagination_class = SubscriptionCursorPagination
 
     def get_queryset(self):
-        return User.objects.filter(subscription__user=self.request.user)
+        return User.objects.filter(
+            subscription__user=self.request.user
+        ).annotate(is_subscribed=Value(True, output_field=BooleanField()))
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            self.prefetch_latest_recipes(page)
+        return page
+
+    def prefetch_latest_recipes(self, authors):
+        limit = self.request.query_params.get('recipes_limit', '')
+        recipes = Recipe.objects.filter(author__in=authors).only(
+            'id', 'name', 'image', 'image_variants_ready', 'cooking_time',
+            'author_id',
+        )
+        if limit.isdigit():
+            # последние recipes_limit рецептов каждого автора одним запросом
+            sql, params = recipes.annotate(position=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').desc()],
+            )).order_by().query.sql_with_params()
+            recipes = Recipe.objects.raw(
+                f'SELECT * FROM ({sql}) latest '
+                f'WHERE latest.position <= %s '
+                f'ORDER BY latest.author_id, latest.position',
+                (*params, int(limit)),
+            )
+        latest_recipes = defaultdict(list)
+        for recipe in recipes:
+            latest_recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.latest_recipes = latest_recipes[author.id]
 
 
 class APISubscription(APIView):
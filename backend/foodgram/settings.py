@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -33,6 +34,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -43,6 +45,31 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# загружаемые файлы пишутся во временный файл частями, а не в память
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+QUERY_INSTRUMENTATION = os.getenv('QUERY_INSTRUMENTATION', default=False) == 'True'
+QUERY_INSTRUMENTATION_REPEAT_LIMIT = 5
+QUERY_INSTRUMENTATION_SLOWEST = 3
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.sql': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -82,6 +109,31 @@ else:
         }
     }
 
+# версии в кэше должны быть общими для веб-процесса, консольных команд
+# и генератора миниатюр, поэтому кэш по умолчанию файловый, а не в памяти
+# процесса; в docker-compose используется memcached
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=os.path.join(tempfile.gettempdir(), 'foodgram-cache')),
+    },
+    # отдельное хранилище для benchmark_api, который очищает его целиком
+    'benchmark': {
+        'BACKEND': os.getenv('BENCHMARK_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('BENCHMARK_CACHE_LOCATION', default='foodgram-benchmark'),
+        'KEY_PREFIX': 'benchmark',
+    },
+}
+
+if CACHES['default']['BACKEND'].endswith('.FileBasedCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+
+RELATION_CACHE_TIMEOUT = 60 * 60
+RESPONSE_CACHE_TIMEOUT = 60 * 10
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+SHOPPING_LIST_CACHE_MAX_SIZE = 1024 * 1024
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -140,6 +192,11 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMPORT_IMAGE_DIR = os.getenv(
+    'RECIPE_IMPORT_IMAGE_DIR', default=os.path.join(BASE_DIR, 'data', 'images')
+)
+RECIPE_IMPORT_BATCH_SIZE = 500
+
 CORS_URLS_REGEX = r'^/api/.*$'
 
 CORS_ALLOWED_ORIGINS = [
@@ -151,3 +208,4 @@ EMAIL_MAX_LENGTH = 254
 USER_MAX_LENGTH = 150
 COLOR_MAX_LENGTH = 7
 STR_MAX_LENGTH = 30
+RELATION_BATCH_MAX_SIZE = 100
@@ -41,7 +41,7 @@ class RecipeAdmin(admin.ModelAdmin):
         'pk', 'name',
         'author', 'get_image',
         'pub_date', 'get_ingredients',
-        'get_tags', 'get_count_favorites',
+        'get_tags', 'favorites_count',
     )
     list_filter = ('name', 'author', 'tags',)
     list_editable = ('name', 'author',)
@@ -60,10 +60,6 @@ class RecipeAdmin(admin.ModelAdmin):
             tag.name for tag in obj.tags.all()
         ])
 
-    @admin.display(description='Кол-во в избранном')
-    def get_count_favorites(self, obj):
-        return obj.favorites.count()
-
     @admin.display(description='Изображение')
     def get_image(self, obj):
         return mark_safe(f'<img src={obj.image.url} width="80" height="60">')
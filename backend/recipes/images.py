@@ -0,0 +1,87 @@
+import os
+from io import BytesIO
+
+from PIL import Image
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+# уменьшенные копии изображений рецептов для карточек в списках
+IMAGE_VARIANTS = {
+    'thumbnail': (320, 320),
+    'medium': (640, 640),
+}
+IMAGE_FORMATS = {
+    'jpeg': ('JPEG', 85),
+    'webp': ('WEBP', 80),
+}
+VARIANTS_DIR = 'recipes/variants'
+
+
+def variant_name(name, variant, image_format='jpeg'):
+    """Путь копии однозначно выводится из пути оригинала, поэтому адрес
+    строится без обращения к хранилищу и базе данных.
+
+    В путь входят каталог и расширение оригинала: photo.jpg и photo.png
+    разных рецептов не должны делить копии.
+    """
+    root, extension = os.path.splitext(name)
+    return (
+        f'{VARIANTS_DIR}/{root}{extension.replace(".", "-")}'
+        f'_{variant}.{image_format}'
+    )
+
+
+def variant_names(name):
+    return [
+        variant_name(name, variant, image_format)
+        for variant in IMAGE_VARIANTS
+        for image_format in IMAGE_FORMATS
+    ]
+
+
+def variant_urls(name):
+    return {
+        variant: {
+            image_format: default_storage.url(
+                variant_name(name, variant, image_format)
+            )
+            for image_format in IMAGE_FORMATS
+        }
+        for variant in IMAGE_VARIANTS
+    }
+
+
+def crop_to_box(picture, size):
+    # уменьшение с обрезкой по центру, без увеличения маленьких картинок
+    width, height = size
+    scale = max(width / picture.width, height / picture.height)
+    if scale < 1:
+        picture = picture.resize(
+            (round(picture.width * scale), round(picture.height * scale)),
+            Image.LANCZOS,
+        )
+    width, height = min(width, picture.width), min(height, picture.height)
+    left = (picture.width - width) // 2
+    top = (picture.height - height) // 2
+    return picture.crop((left, top, left + width, top + height))
+
+
+def generate_variants(name, storage=default_storage):
+    with storage.open(name) as file, Image.open(file) as picture:
+        picture = picture.convert('RGB')
+        for variant, size in IMAGE_VARIANTS.items():
+            resized = crop_to_box(picture, size)
+            for image_format, (pillow_format, quality) in (
+                IMAGE_FORMATS.items()
+            ):
+                buffer = BytesIO()
+                resized.save(buffer, pillow_format, quality=quality)
+                path = variant_name(name, variant, image_format)
+                storage.delete(path)
+                storage.save(path, ContentFile(buffer.getvalue()))
+
+
+def delete_variants(name, storage=default_storage):
+    for path in variant_names(name):
+        storage.delete(path)
@@ -0,0 +1,306 @@
+import json
+import os
+from collections import Counter
+from itertools import islice
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from api.cache import bump_tags
+from api.recipe_index import log_changes_on_commit
+from recipes.models import (
+    Ingredient, IngredientRecipe, Recipe, Tag, TagRecipe,
+)
+from recipes.search import index_recipes
+from users.models import User
+
+SMALL_INTEGER_MAX = 32767
+
+
+def is_positive_integer(value, limit=SMALL_INTEGER_MAX):
+    return (
+        isinstance(value, int) and not isinstance(value, bool)
+        and 1 <= value <= limit
+    )
+
+
+class RecipeImporter:
+    """Пакетный импорт рецептов из NDJSON.
+
+    Каждая строка - объект с полями name, text, cooking_time, tags
+    (slug или id), ingredients (id или name и measurement_unit вместе
+    с amount), необязательными image (путь внутри каталога изображений)
+    и author (email). Записи проверяются и сохраняются пачками по
+    batch_size, каждая пачка - в отдельной транзакции. Если пачка
+    нарушает ограничение уникальности, записи сохраняются по одной
+    и конфликтующие попадают в отчет об ошибках.
+    """
+
+    def __init__(self, author=None, image_dir=None, batch_size=None):
+        self.default_author = author
+        self.image_dir = os.path.realpath(
+            image_dir or settings.RECIPE_IMPORT_IMAGE_DIR
+        )
+        self.batch_size = batch_size or settings.RECIPE_IMPORT_BATCH_SIZE
+        self.created = 0
+        self.failed = 0
+        self.ingredient_names = {}
+        self.ingredient_ids = {}
+        for pk, name, unit in Ingredient.objects.values_list(
+            'pk', 'name', 'measurement_unit'
+        ).iterator():
+            self.ingredient_names[pk] = name
+            self.ingredient_ids[(name.lower(), unit.lower())] = pk
+        self.tag_slugs = dict(Tag.objects.values_list('pk', 'slug'))
+        self.tag_ids = {slug: pk for pk, slug in self.tag_slugs.items()}
+
+    def run(self, lines):
+        """Импортирует записи и возвращает ошибки по номерам строк."""
+        records = self._parse(lines)
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                return
+            yield from self._import_batch(batch)
+
+    def _parse(self, lines):
+        for number, line in enumerate(lines, 1):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', errors='replace')
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not isinstance(record, dict):
+                yield number, None, {'record': 'Ожидается JSON-объект.'}
+                continue
+            yield (number, *self._clean(record))
+
+    def _clean(self, record):
+        errors = {}
+        name = record.get('name')
+        if not isinstance(name, str) or not name.strip():
+            errors['name'] = 'Обязательное поле.'
+        elif len(name) > settings.CHAR_MAX_LENGTH:
+            errors['name'] = (
+                f'Не более {settings.CHAR_MAX_LENGTH} символов.'
+            )
+        text = record.get('text')
+        if not isinstance(text, str) or not text.strip():
+            errors['text'] = 'Обязательное поле.'
+        if not is_positive_integer(record.get('cooking_time')):
+            errors['cooking_time'] = (
+                'Минимальное время приготовления - 1 минута.'
+            )
+        tags, tag_errors = self._clean_tags(record.get('tags'))
+        if tag_errors:
+            errors['tags'] = tag_errors
+        ingredients, ingredient_errors = self._clean_ingredients(
+            record.get('ingredients')
+        )
+        if ingredient_errors:
+            errors['ingredients'] = ingredient_errors
+        image, image_error = self._clean_image(record.get('image'))
+        if image_error:
+            errors['image'] = image_error
+        author = record.get('author') or self.default_author
+        if not isinstance(author, (str, User)):
+            errors['author'] = 'Укажите email автора рецепта.'
+        if errors:
+            return None, errors
+        return {
+            'name': name, 'text': text,
+            'cooking_time': record['cooking_time'],
+            'tags': tags, 'ingredients': ingredients,
+            'image': image, 'author': author,
+        }, None
+
+    def _clean_tags(self, tags):
+        if not isinstance(tags, list) or not tags:
+            return None, 'Добавьте хотя бы один тег.'
+        ids = []
+        for tag in tags:
+            if not isinstance(tag, (int, str)):
+                return None, 'Ожидается slug или id тега.'
+            pk = tag if tag in self.tag_slugs else self.tag_ids.get(tag)
+            if pk is None:
+                return None, f'Тег "{tag}" не существует.'
+            ids.append(pk)
+        if len(set(ids)) < len(ids):
+            return None, 'Выбраны повторяющиеся теги.'
+        return ids, None
+
+    def _clean_ingredients(self, ingredients):
+        if not isinstance(ingredients, list) or not ingredients:
+            return None, 'Добавьте хотя бы одно наименование ингредиента.'
+        amounts = {}
+        for ingredient in ingredients:
+            if not isinstance(ingredient, dict):
+                return None, 'Ожидается объект ингредиента.'
+            pk = ingredient.get('id')
+            if not isinstance(pk, int) or pk not in self.ingredient_names:
+                pk = self.ingredient_ids.get((
+                    str(ingredient.get('name', '')).lower(),
+                    str(ingredient.get('measurement_unit', '')).lower(),
+                ))
+            if pk is None:
+                return None, f'Ингредиент {ingredient} не существует.'
+            if pk in amounts:
+                return None, 'Выбраны повторяющиеся ингредиенты.'
+            if not is_positive_integer(ingredient.get('amount')):
+                return None, 'Минимальное количество ингредиентов - 1 ед.'
+            amounts[pk] = ingredient['amount']
+        return amounts, None
+
+    def _clean_image(self, image):
+        if not image:
+            return None, None
+        if not isinstance(image, str):
+            return None, 'Ожидается путь к файлу.'
+        path = os.path.realpath(os.path.join(self.image_dir, image))
+        if os.path.commonpath((path, self.image_dir)) != self.image_dir:
+            return None, 'Файл должен находиться в каталоге изображений.'
+        try:
+            with Image.open(path) as picture:
+                picture.verify()
+        except (OSError, SyntaxError, ValueError):
+            return None, 'Файл не найден или не является изображением.'
+        return path, None
+
+    def _resolve_authors(self, records):
+        emails = {
+            record['author'] for _, record in records
+            if not isinstance(record['author'], User)
+        }
+        authors = User.objects.in_bulk(emails, field_name='email')
+        for record in (record for _, record in records):
+            author = record['author']
+            if not isinstance(author, User):
+                record['author'] = authors.get(author)
+
+    def _import_batch(self, batch):
+        records = []
+        for number, record, errors in batch:
+            if errors:
+                self.failed += 1
+                yield {'line': number, 'errors': errors}
+            else:
+                records.append((number, record))
+        self._resolve_authors(records)
+        existing = set(Recipe.objects.filter(
+            author__in={
+                record['author'] for _, record in records if record['author']
+            },
+            name__in={record['name'] for _, record in records},
+        ).values_list('author_id', 'name'))
+        valid = []
+        for number, record in records:
+            if record['author'] is None:
+                error = {'author': 'Пользователь не существует.'}
+            elif (record['author'].pk, record['name']) in existing:
+                error = {'name, author': 'Данный рецепт опубликован ранее.'}
+            else:
+                error = None
+            if error:
+                self.failed += 1
+                yield {'line': number, 'errors': error}
+                continue
+            existing.add((record['author'].pk, record['name']))
+            valid.append((number, record))
+        if valid:
+            yield from self._save_batch(valid)
+
+    def _save_batch(self, records):
+        try:
+            self._save([record for _, record in records])
+            return
+        except IntegrityError:
+            # такой же рецепт мог появиться после проверки, например
+            # при параллельном импорте; пачка откачена, и записи
+            # сохраняются по одной, чтобы отклонить только конфликтующие
+            pass
+        for number, record in records:
+            try:
+                self._save([record])
+            except IntegrityError:
+                self.failed += 1
+                yield {'line': number, 'errors': {
+                    'name, author': 'Данный рецепт опубликован ранее.',
+                }}
+
+    def _save(self, records):
+        images = []
+        try:
+            with transaction.atomic():
+                self._insert(records, images)
+        except Exception:
+            # файлы не откатываются вместе с транзакцией
+            for image in images:
+                image.storage.delete(image.name)
+            raise
+
+    def _insert(self, records, images):
+        recipes = []
+        for record in records:
+            recipe = Recipe(
+                name=record['name'], text=record['text'],
+                cooking_time=record['cooking_time'], author=record['author'],
+            )
+            if record['image']:
+                with open(record['image'], 'rb') as file:
+                    recipe.image.save(
+                        os.path.basename(record['image']), File(file),
+                        save=False,
+                    )
+                images.append(recipe.image)
+            recipes.append(recipe)
+        Recipe.objects.bulk_create(recipes, batch_size=self.batch_size)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # SQLite не возвращает id вставленных строк, они находятся
+            # по уникальной паре автор - наименование
+            ids = {
+                (author_id, name): pk
+                for pk, author_id, name in Recipe.objects.filter(
+                    author__in={recipe.author_id for recipe in recipes},
+                    name__in={recipe.name for recipe in recipes},
+                ).values_list('pk', 'author_id', 'name')
+            }
+            for recipe in recipes:
+                recipe.pk = ids[(recipe.author_id, recipe.name)]
+        links, tag_links = [], []
+        for recipe, record in zip(recipes, records):
+            links.extend(
+                IngredientRecipe(
+                    recipe_id=recipe.pk, ingredient_id=pk, amount=amount,
+                )
+                for pk, amount in record['ingredients'].items()
+            )
+            tag_links.extend(
+                TagRecipe(recipe_id=recipe.pk, tag_id=pk)
+                for pk in record['tags']
+            )
+        IngredientRecipe.objects.bulk_create(links, batch_size=self.batch_size)
+        TagRecipe.objects.bulk_create(tag_links, batch_size=self.batch_size)
+        # bulk_create минует сигналы: счетчики, поиск и кэш обновляются здесь
+        index_recipes(recipe.pk for recipe in recipes)
+        log_changes_on_commit(
+            (1, link.ingredient_id, link.recipe_id) for link in links
+        )
+        authors = Counter(recipe.author_id for recipe in recipes)
+        for author_id, count in authors.items():
+            User.objects.filter(pk=author_id).update(
+                recipes_count=F('recipes_count') + count
+            )
+        tags = {
+            'list',
+            *(f'list:author:{author_id}' for author_id in authors),
+            *(f'list:tag:{self.tag_slugs[link.tag_id]}' for link in tag_links),
+        }
+        transaction.on_commit(lambda: bump_tags(tags))
+        self.created += len(recipes)
@@ -0,0 +1,263 @@
+import random
+from array import array
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection, transaction
+
+from api.cache import POPULAR_LIST, bump_tags
+from api.recipe_index import RECIPE_INDEX
+from recipes.models import (
+    Favorite, Ingredient, IngredientRecipe,
+    Recipe, ShoppingCart, Tag, TagRecipe,
+)
+from recipes.search import index_recipes
+from users.models import Subscription, User
+
+PASSWORD = 'foodgram-fake-password'
+DISHES = (
+    'Суп', 'Салат', 'Пирог', 'Рагу', 'Омлет', 'Каша', 'Запеканка',
+    'Паста', 'Плов', 'Блины', 'Котлеты', 'Десерт', 'Соус', 'Смузи',
+)
+WORDS = (
+    'нарезать', 'обжарить', 'добавить', 'посолить', 'перемешать',
+    'запекать', 'варить', 'минут', 'до', 'готовности', 'на', 'среднем',
+    'огне', 'подавать', 'горячим', 'с', 'зеленью', 'остудить', 'тесто',
+    'духовке', 'сковороде', 'кастрюле', 'соус', 'овощи', 'мясо',
+)
+# Парето с alpha=1.5 дает тяжелый хвост со средним значением 3
+PARETO_ALPHA = 1.5
+PARETO_MEAN = 3
+WEIGHTED_ROUNDS = 3
+
+
+def zipf_cum_weights(size, exponent):
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+def heavy_tail(rnd, mean, limit):
+    return min(
+        int(rnd.paretovariate(PARETO_ALPHA) * mean / PARETO_MEAN), limit
+    )
+
+
+def distinct_choices(rnd, population, cum_weights, k):
+    """k разных элементов, частые по весам выбираются чаще.
+
+    Выборка с возвращением повторяется ограниченное число раз: при k,
+    сравнимом с размером популяции, редкие элементы почти не выпадают.
+    Остаток добирается равномерной выборкой без возвращения.
+    """
+    k = min(k, len(population))
+    chosen = set()
+    for _ in range(WEIGHTED_ROUNDS):
+        if len(chosen) == k:
+            return chosen
+        chosen.update(rnd.choices(
+            population, cum_weights=cum_weights, k=k - len(chosen)
+        ))
+    rest = [item for item in rnd.sample(population, k) if item not in chosen]
+    chosen.update(rest[:k - len(chosen)])
+    return chosen
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетических данных для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--max-ingredients', type=int, default=12)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Среднее число избранных на пользователя')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Среднее число рецептов в корзине')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Среднее число подписок на пользователя')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def _bulk_create(self, model, objects):
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size, ignore_conflicts=True,
+        )
+
+    def _insert_rows(self, model, fields, rows):
+        # связи вставляются напрямую, минуя создание объектов моделей
+        columns = ', '.join(model._meta.get_field(field).column
+                            for field in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {model._meta.db_table} ({columns}) '
+                f'VALUES ({placeholders}) ON CONFLICT DO NOTHING',
+                rows,
+            )
+
+    def _create_users(self, count):
+        prefix = f'fake{self.seed}_'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Users with the "{prefix}" prefix already exist, '
+                f'use another --seed.'
+            )
+        password = make_password(PASSWORD)
+        for start in range(0, count, self.batch_size):
+            self._bulk_create(User, [
+                User(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name='Имя',
+                    last_name=f'Фамилия{number}',
+                    password=password,
+                )
+                for number in range(start, min(start + self.batch_size, count))
+            ])
+        self.stdout.write(f'Users are created: {count}.')
+        return array('l', User.objects.filter(
+            username__startswith=prefix
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def _create_links(self, recipe_ids):
+        links, tag_links = [], []
+        for recipe_id in recipe_ids:
+            ingredient_ids = distinct_choices(
+                self.rnd, self.ingredient_ids, self.ingredient_weights,
+                self.rnd.randint(3, self.max_ingredients),
+            )
+            links.extend(
+                (recipe_id, ingredient_id, self.rnd.randint(1, 500))
+                for ingredient_id in ingredient_ids
+            )
+            tag_links.extend(
+                (recipe_id, tag_id)
+                for tag_id in self.rnd.sample(
+                    self.tag_ids, self.rnd.randint(1, len(self.tag_ids))
+                )
+            )
+        self._insert_rows(
+            IngredientRecipe, ('recipe', 'ingredient', 'amount'), links,
+        )
+        self._insert_rows(TagRecipe, ('recipe', 'tag'), tag_links)
+
+    def _create_recipes(self, count, user_ids):
+        author_weights = zipf_cum_weights(len(user_ids), 1.1)
+        last_pk = Recipe.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        recipe_ids = array('l')
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            authors = self.rnd.choices(
+                user_ids, cum_weights=author_weights, k=size
+            )
+            self._bulk_create(Recipe, [
+                Recipe(
+                    name=(
+                        f'{self.rnd.choice(DISHES)} '
+                        f'{self.seed}-{start + number}'
+                    ),
+                    author_id=author_id,
+                    text=' '.join(
+                        self.rnd.choices(WORDS, k=self.rnd.randint(20, 60))
+                    ),
+                    cooking_time=min(
+                        max(int(self.rnd.lognormvariate(3.4, 0.6)), 1), 600
+                    ),
+                )
+                for number, author_id in enumerate(authors)
+            ])
+            batch_ids = array('l', Recipe.objects.filter(
+                pk__gt=last_pk
+            ).order_by('pk').values_list('pk', flat=True))
+            last_pk = batch_ids[-1]
+            self._create_links(batch_ids)
+            recipe_ids.extend(batch_ids)
+            self.stdout.write(f'Recipes are created: {len(recipe_ids)}.')
+        return recipe_ids
+
+    def _create_user_relations(self, model, user_ids, targets, weights,
+                               mean, field):
+        relations, total = [], 0
+        for user_id in user_ids:
+            count = heavy_tail(self.rnd, mean, len(targets) // 2)
+            relations.extend(
+                (user_id, target_id)
+                for target_id in distinct_choices(
+                    self.rnd, targets, weights, count
+                )
+                if target_id != user_id or field != 'author'
+            )
+            if len(relations) >= self.batch_size:
+                self._insert_rows(model, ('user', field), relations)
+                total += len(relations)
+                relations = []
+        self._insert_rows(model, ('user', field), relations)
+        total += len(relations)
+        self.stdout.write(
+            f'Data for the {model.__name__} table is created: {total}.'
+        )
+
+    def handle(self, *args, **options):
+        self.seed = options['seed']
+        self.rnd = random.Random(self.seed)
+        self.batch_size = options['batch_size']
+        self.max_ingredients = options['max_ingredients']
+        self.ingredient_ids = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        self.tag_ids = list(
+            Tag.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        if len(self.ingredient_ids) < self.max_ingredients * 2:
+            raise CommandError('Load ingredients first: manage.py load_data')
+        if not self.tag_ids:
+            raise CommandError('Load tags first: manage.py load_data')
+        # популярность ингредиентов и рецептов распределена по Ципфу,
+        # ранги перемешаны, чтобы не зависеть от порядка id
+        self.rnd.shuffle(self.ingredient_ids)
+        self.ingredient_weights = zipf_cum_weights(
+            len(self.ingredient_ids), 1.0
+        )
+        with transaction.atomic():
+            user_ids = self._create_users(options['users'])
+            recipe_ids = list(self._create_recipes(
+                options['recipes'], user_ids
+            ))
+            self.rnd.shuffle(recipe_ids)
+            recipe_weights = zipf_cum_weights(len(recipe_ids), 1.0)
+            self._create_user_relations(
+                Favorite, user_ids, recipe_ids, recipe_weights,
+                options['favorites'], 'recipe',
+            )
+            self._create_user_relations(
+                ShoppingCart, user_ids, recipe_ids, recipe_weights,
+                options['cart'], 'recipe',
+            )
+            self._create_user_relations(
+                Subscription, user_ids, list(user_ids),
+                zipf_cum_weights(len(user_ids), 1.1),
+                options['subscriptions'], 'author',
+            )
+            call_command('recount_counters', stdout=self.stdout)
+            # массовая вставка минует сигналы, синхронизирующие поиск
+            index_recipes()
+        # массовая вставка минует сигналы; новые рецепты и пользователи
+        # еще не попадали в кэш, сбрасываются только общие списки
+        # и индекс ингредиентов рецептов
+        bump_tags((
+            'list', POPULAR_LIST, RECIPE_INDEX,
+            *(f'list:tag:{slug}' for slug in Tag.objects.values_list(
+                'slug', flat=True
+            )),
+        ))
+        # свежая статистика нужна планировщику, чтобы соединять таблицы
+        # связей и полнотекстовый индекс в правильном порядке
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(
+            f'Fake data is generated! Password for all users: {PASSWORD}'
+        )
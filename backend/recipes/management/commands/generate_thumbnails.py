@@ -0,0 +1,58 @@
+import time
+
+from django.core.management import BaseCommand
+
+from api.cache import bump_tags
+from recipes.images import generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Создание уменьшенных копий изображений рецептов, для которых '
+        'они еще не созданы; с --watch команда работает как фоновый процесс'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Пересоздать копии для всех изображений')
+        parser.add_argument('--watch', type=int, metavar='SECONDS',
+                            help='Проверять новые изображения с интервалом')
+
+    def _generate(self, recipes):
+        total = failed = 0
+        for pk, image in recipes.exclude(
+            image__in=self.broken
+        ).values_list('pk', 'image').iterator():
+            total += 1
+            try:
+                generate_variants(image)
+            except OSError as error:
+                failed += 1
+                # в режиме --watch битые файлы не обрабатываются повторно
+                self.broken.add(image)
+                self.stderr.write(f'{image}: {error}')
+                continue
+            # изображение могли заменить, пока создавались копии
+            if Recipe.objects.filter(pk=pk, image=image).update(
+                image_variants_ready=True
+            ):
+                bump_tags((f'recipe:{pk}',))
+        return total, failed
+
+    def handle(self, *args, **options):
+        self.broken = set()
+        images = Recipe.objects.exclude(image='').order_by()
+        pending = images.filter(image_variants_ready=False)
+        recipes = images if options['all'] else pending
+        while True:
+            total, failed = self._generate(recipes)
+            if total or not options['watch']:
+                self.stdout.write(
+                    f'Thumbnails are generated for {total - failed} images, '
+                    f'failed: {failed}.'
+                )
+            if not options['watch']:
+                return
+            recipes = pending
+            time.sleep(options['watch'])
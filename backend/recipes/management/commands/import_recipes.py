@@ -0,0 +1,42 @@
+import json
+import sys
+
+from django.core.management import BaseCommand
+
+from recipes.importer import RecipeImporter
+
+
+class Command(BaseCommand):
+    help = 'Импорт рецептов из файлов NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument('--author', help='email автора по умолчанию')
+        parser.add_argument('--images', help='Каталог с изображениями')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--report', help='Файл для отчета об ошибках')
+
+    def handle(self, *args, **options):
+        importer = RecipeImporter(
+            author=options['author'],
+            image_dir=options['images'],
+            batch_size=options['batch_size'],
+        )
+        report = (
+            open(options['report'], 'w', encoding='utf-8')
+            if options['report'] else sys.stderr
+        )
+        try:
+            for path in options['paths']:
+                with open(path, encoding='utf-8') as file:
+                    for error in importer.run(file):
+                        report.write(json.dumps(
+                            {'file': path, **error}, ensure_ascii=False
+                        ) + '\n')
+        finally:
+            if report is not sys.stderr:
+                report.close()
+        self.stdout.write(
+            f'Recipes are imported: {importer.created}, '
+            f'failed: {importer.failed}.'
+        )
@@ -1,42 +1,167 @@
 import csv
+import io
+import json
+import os
+from itertools import islice
 
-from django.core.management import BaseCommand
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from api.cache import bump_tags
+from api.catalog import INGREDIENTS_CATALOG, TAGS_CATALOG
 from recipes.models import Ingredient, Tag
 
 TAGS = (
     ('Завтрак', '#9ACD32', 'breakfast',), ('Обед', '#FFA500', 'lunch',),
     ('Ужин', '#FA8072', 'dinner',), ('Десерт', '#4A8EF6', 'dessert',),
 )
+DEFAULT_PATHS = (
+    os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+    os.path.join(settings.BASE_DIR, 'data', 'ingredients.json'),
+)
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        yield tuple(row)
+
+
+def read_json(file):
+    # стандартный json не разбирает массив потоково, поэтому большие
+    # каталоги лучше передавать в формате NDJSON
+    for item in json.load(file):
+        yield item.get('name'), item.get('measurement_unit')
+
+
+def read_ndjson(file):
+    for line in file:
+        if line.strip():
+            item = json.loads(line)
+            yield item.get('name'), item.get('measurement_unit')
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+    '.jsonl': read_ndjson,
+    '.ndjson': read_ndjson,
+}
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
 
 
 class Command(BaseCommand):
-    help = 'Загрузка данных из .csv файлов'
-
-    def _load_ingredients(self):
-        with open(
-                'data/ingredients.csv',
-                encoding='utf-8'
-        ) as csvfile:
-            reader = csv.reader(csvfile)
-            self.stdout.write('Data loading started!')
-            for name, measurement_unit in reader:
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit,
-                )
-        self.stdout.write('Data for the Ingredient table is loaded!')
+    help = 'Загрузка данных из .csv и .json файлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def _read_rows(self, path):
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError(f'Unsupported file format: {path}')
+        with open(path, encoding='utf-8') as file:
+            for row in reader(file):
+                if len(row) == 2 and all(row):
+                    yield row
+                else:
+                    self.invalid += 1
+
+    def _insert_batch(self, batch):
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in batch
+            ],
+            ignore_conflicts=True,
+        )
+
+    def _create_staging_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_staging '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+            )
+
+    def _copy_batch(self, batch):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                'COPY ingredient_staging (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+
+    def _merge_staging_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {Ingredient._meta.db_table} '
+                f'(name, measurement_unit) '
+                f'SELECT DISTINCT name, measurement_unit '
+                f'FROM ingredient_staging '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+
+    def _load_ingredients(self, paths, batch_size):
+        self.stdout.write('Data loading started!')
+        use_copy = connection.vendor == 'postgresql'
+        if use_copy:
+            self._create_staging_table()
+        load_batch = self._copy_batch if use_copy else self._insert_batch
+        count_before = Ingredient.objects.count()
+        total = 0
+        self.invalid = 0
+        for path in paths:
+            for batch in batches(self._read_rows(path), batch_size):
+                load_batch(batch)
+                total += len(batch)
+        if use_copy:
+            self._merge_staging_table()
+        transaction.on_commit(lambda: bump_tags((INGREDIENTS_CATALOG,)))
+        inserted = Ingredient.objects.count() - count_before
+        self.stdout.write(
+            f'Data for the Ingredient table is loaded! '
+            f'Inserted: {inserted}, skipped: {total - inserted}, '
+            f'invalid: {self.invalid}.'
+        )
 
     def _load_tags(self):
         self.stdout.write('Data loading started!')
+        existing = Tag.objects.in_bulk(
+            [slug for _, _, slug in TAGS], field_name='slug',
+        )
+        new_tags, changed_tags = [], []
         for name, color, slug in TAGS:
-            Tag.objects.get_or_create(
-                name=name,
-                color=color,
-                slug=slug,
-            )
-        self.stdout.write('Data for the Ingredient table is loaded!')
+            tag = existing.get(slug)
+            if tag is None:
+                new_tags.append(Tag(name=name, color=color, slug=slug))
+            elif (tag.name, tag.color) != (name, color):
+                tag.name, tag.color = name, color
+                changed_tags.append(tag)
+        Tag.objects.bulk_create(new_tags)
+        Tag.objects.bulk_update(changed_tags, ('name', 'color'))
+        transaction.on_commit(lambda: bump_tags((
+            TAGS_CATALOG, *(f'tag:{tag.slug}' for tag in changed_tags),
+        )))
+        self.stdout.write(
+            f'Data for the Tag table is loaded! '
+            f'Inserted: {len(new_tags)}, updated: {len(changed_tags)}, '
+            f'skipped: {len(TAGS) - len(new_tags) - len(changed_tags)}.'
+        )
 
     def handle(self, *args, **options):
-        self._load_ingredients()
-        self._load_tags()
+        with transaction.atomic():
+            self._load_ingredients(options['paths'], options['batch_size'])
+            self._load_tags()
@@ -0,0 +1,50 @@
+from django.core.management import BaseCommand
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.cache import POPULAR_LIST, bump_tags
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+
+def count_subquery(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков рецептов и пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def _recount(self, model, batch_size, **counters):
+        last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        updated = 0
+        for start in range(0, last_pk + 1, batch_size):
+            updated += model.objects.filter(
+                pk__gte=start, pk__lt=start + batch_size,
+            ).update(**counters)
+        self.stdout.write(
+            f'Counters for the {model.__name__} table are recounted: '
+            f'{updated} rows.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        self._recount(
+            Recipe, batch_size,
+            favorites_count=count_subquery(Favorite, 'recipe'),
+            in_carts_count=count_subquery(ShoppingCart, 'recipe'),
+        )
+        bump_tags((POPULAR_LIST,))
+        self._recount(
+            User, batch_size,
+            recipes_count=count_subquery(Recipe, 'author'),
+            followers_count=count_subquery(Subscription, 'author'),
+        )
@@ -0,0 +1,49 @@
+# Generated by Django 3.2 on 2026-10-17 06:32
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicate_links(apps, schema_editor):
+    # перед уникальным ограничением остается первая из повторных связей
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = IngredientRecipe.objects.values(
+        'recipe', 'ingredient'
+    ).annotate(first=Min('id'), total=Count('id')).filter(total__gt=1)
+    for duplicate in duplicates:
+        IngredientRecipe.objects.filter(
+            recipe=duplicate['recipe'], ingredient=duplicate['ingredient'],
+        ).exclude(id=duplicate['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', 'recipe'], name='favorite_user_recipe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredientrecipe',
+            index=models.Index(fields=['ingredient', 'recipe'], name='ingredientrecipe_ingr_recipe'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['user', 'recipe'], name='shoppingcart_user_recipe_idx'),
+        ),
+        migrations.RunPython(
+            delete_duplicate_links, migrations.RunPython.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def reset_image_variants(apps, schema_editor):
+    # имена копий теперь включают каталог и расширение оригинала,
+    # generate_thumbnails создаст их заново
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(image_variants_ready=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_recipe_image_variants_ready'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            reset_image_variants, migrations.RunPython.noop,
+        ),
+    ]
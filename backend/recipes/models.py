@@ -78,6 +78,11 @@ class Recipe(models.Model):
         upload_to='recipes/',
         blank=True,
     )
+    image_variants_ready = models.BooleanField(
+        'Уменьшенные копии созданы',
+        default=False,
+        editable=False,
+    )
     text = models.TextField('Описание', )
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -95,6 +100,16 @@ class Recipe(models.Model):
             1, 'Минимальное время приготовления - 1 минута.'
         )]
     )
+    favorites_count = models.PositiveIntegerField(
+        'Кол-во в избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'Кол-во в списках покупок',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
@@ -106,6 +121,26 @@ class Recipe(models.Model):
                 name='unique_author_recipe',
             ),
         ]
+        # по индексу на каждый порядок выдачи списка рецептов
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_newest_idx',
+            ),
+            # рецепты автора и последние рецепты в подписках
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_newest_idx',
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_popular_idx',
+            ),
+            models.Index(
+                fields=['cooking_time', '-pub_date', '-id'],
+                name='recipe_quickest_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -133,6 +168,19 @@ class IngredientRecipe(models.Model):
         verbose_name = 'Количество ингредиента'
         verbose_name_plural = 'Количество ингредиентов'
         ordering = ('recipe',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_recipe_ingredient',
+            ),
+        ]
+        # обратный порядок для построения индекса рецептов по ингредиентам
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='ingredientrecipe_ingr_recipe',
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -157,6 +205,12 @@ class TagRecipe(models.Model):
         verbose_name = 'Тег рецепта'
         verbose_name_plural = 'Теги рецептов'
         ordering = ('recipe',)
+        indexes = [
+            models.Index(
+                fields=['tag', 'recipe'],
+                name='tagrecipe_tag_recipe_idx',
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -180,6 +234,13 @@ class FavoriteShoppingCartBaseModel(models.Model):
     class Meta:
         abstract = True
         ordering = ('recipe',)
+        # id рецептов пользователя читаются только из индекса
+        indexes = [
+            models.Index(
+                fields=['user', 'recipe'],
+                name='%(class)s_user_recipe_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.recipe.name[:settings.STR_MAX_LENGTH]
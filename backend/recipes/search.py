@@ -0,0 +1,118 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from recipes.models import Recipe
+
+# PostgreSQL хранит tsvector в генерируемом столбце search_vector
+# с GIN-индексом, SQLite - в отдельной таблице FTS5, которая
+# синхронизируется сигналами и массовыми загрузками
+SEARCH_CONFIG = 'russian'
+SEARCH_TABLE = 'recipes_recipe_search'
+NAME_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+INDEX_CHUNK_SIZE = 500
+WORD = re.compile(r'\w+')
+
+
+def postgresql_search(queryset, query):
+    tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+    vector = f'{Recipe._meta.db_table}.search_vector'
+    return queryset.annotate(
+        search_match=RawSQL(
+            f'{vector} @@ {tsquery}', (query,), output_field=BooleanField()
+        ),
+        search_rank=RawSQL(
+            f'ts_rank({vector}, {tsquery})', (query,),
+            output_field=FloatField(),
+        ),
+    ).filter(search_match=True)
+
+
+def sqlite_search(queryset, query):
+    words = WORD.findall(query)
+    if not words:
+        # ранг нужен сортировке и курсору и у пустой выборки
+        return queryset.none().annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+    # каждое слово ищется как префикс, что частично заменяет стемминг;
+    # соединение с таблицей FTS5 через extra() позволяет SQLite начинать
+    # выполнение с полнотекстового индекса
+    match = ' '.join(f'"{word}"*' for word in words)
+    # ранг - аннотация, а не extra(select=...), чтобы по нему можно было
+    # фильтровать при постраничной навигации по курсору
+    return queryset.extra(
+        tables=[SEARCH_TABLE],
+        where=[
+            f'+{SEARCH_TABLE}.rowid = {Recipe._meta.db_table}.id',
+            f'{SEARCH_TABLE} MATCH %s',
+        ],
+        params=[match],
+    ).annotate(search_rank=RawSQL(
+        f'-bm25({SEARCH_TABLE}, {NAME_WEIGHT}, {TEXT_WEIGHT})', (),
+        output_field=FloatField(),
+    ))
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под запрос, по убыванию релевантности."""
+    if connection.vendor == 'postgresql':
+        queryset = postgresql_search(queryset, query)
+    elif connection.vendor == 'sqlite':
+        queryset = sqlite_search(queryset, query)
+    else:
+        return queryset.filter(
+            Q(name__icontains=query) | Q(text__icontains=query)
+        )
+    return queryset.order_by('-search_rank', '-pub_date', '-id')
+
+
+def index_recipes(recipe_ids=None):
+    """Обновляет таблицу FTS5 для рецептов или целиком.
+
+    В PostgreSQL search_vector пересчитывается самой базой.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    table = Recipe._meta.db_table
+    with connection.cursor() as cursor:
+        if recipe_ids is None:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, name, text) '
+                f'SELECT id, name, text FROM {table}'
+            )
+            return
+        recipe_ids = list(recipe_ids)
+        for start in range(0, len(recipe_ids), INDEX_CHUNK_SIZE):
+            chunk = recipe_ids[start:start + INDEX_CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, name, text) '
+                f'SELECT id, name, text FROM {table} '
+                f'WHERE id IN ({placeholders})',
+                chunk,
+            )
+
+
+def index_recipe(recipe):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, name, text) '
+            f'VALUES (%s, %s, %s)',
+            (recipe.pk, recipe.name, recipe.text),
+        )
+
+
+def unindex_recipe(recipe_id):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', (recipe_id,)
+        )
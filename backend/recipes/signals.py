@@ -0,0 +1,149 @@
+from threading import local
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+
+from recipes.images import delete_variants
+from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.search import index_recipe, unindex_recipe
+from users.models import User
+
+
+def change_counter(model, pk, field, delta):
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+# удаляемые рецепты и пользователи: каскадное удаление их связей не
+# пересчитывает счетчики построчно, иначе Collector обновлял бы счетчик
+# отдельным запросом на каждую удаленную связь. Отметки у каждого потока
+# свои и привязаны к очереди on_commit транзакции удаления: фиксация и
+# откат заменяют очередь, и отметка неудавшегося удаления устаревает
+deleting = local()
+
+
+def mark_deleting(model, pk, using):
+    marks = getattr(deleting, 'marks', None)
+    if marks is None:
+        marks = deleting.marks = {}
+    marks[model, pk] = transaction.get_connection(using).run_on_commit
+
+
+def unmark_deleting(model, pk):
+    getattr(deleting, 'marks', {}).pop((model, pk), None)
+
+
+def is_deleting(model, pk, using):
+    marks = getattr(deleting, 'marks', {})
+    queue = marks.get((model, pk))
+    if queue is None:
+        return False
+    if queue is transaction.get_connection(using).run_on_commit:
+        return True
+    del marks[model, pk]
+    return False
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, using, **kwargs):
+    # счетчики избранного и корзин удаляются вместе с рецептом
+    mark_deleting(Recipe, instance.pk, using)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, using, **kwargs):
+    mark_deleting(User, instance.pk, using)
+    # по одному запросу на каждый счетчик вместо запроса на каждую связь;
+    # пара пользователь-рецепт и пользователь-автор уникальна
+    Recipe.objects.filter(
+        favorites__user=instance, favorites_count__gte=1,
+    ).update(favorites_count=F('favorites_count') - 1)
+    Recipe.objects.filter(
+        shopping_cart__user=instance, in_carts_count__gte=1,
+    ).update(in_carts_count=F('in_carts_count') - 1)
+    User.objects.filter(
+        subscription__user=instance, followers_count__gte=1,
+    ).update(followers_count=F('followers_count') - 1)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, using, **kwargs):
+    if not (is_deleting(Recipe, instance.recipe_id, using)
+            or is_deleting(User, instance.user_id, using)):
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'in_carts_count', 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, instance, using, **kwargs):
+    if not (is_deleting(Recipe, instance.recipe_id, using)
+            or is_deleting(User, instance.user_id, using)):
+        change_counter(Recipe, instance.recipe_id, 'in_carts_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, using, **kwargs):
+    # связи рецепта удаляются раньше него самого
+    unmark_deleting(Recipe, instance.pk)
+    if not is_deleting(User, instance.author_id, using):
+        change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    unmark_deleting(User, instance.pk)
+
+
+def delete_variants_on_commit(name):
+    if name:
+        transaction.on_commit(lambda: delete_variants(name))
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_image_uploaded(sender, instance, **kwargs):
+    # новый файл еще не сохранен в хранилище до сохранения модели;
+    # копии для него создаст generate_thumbnails вне запроса
+    if instance.image and not instance.image._committed:
+        instance.image_variants_ready = False
+        if instance.pk:
+            delete_variants_on_commit(Recipe.objects.filter(
+                pk=instance.pk
+            ).values_list('image', flat=True).first())
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_deleted(sender, instance, **kwargs):
+    delete_variants_on_commit(instance.image.name)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_search_saved(sender, instance, **kwargs):
+    index_recipe(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_search_deleted(sender, instance, **kwargs):
+    unindex_recipe(instance.pk)
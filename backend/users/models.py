@@ -25,6 +25,16 @@ class User(AbstractUser):
         'Фамилия',
         max_length=settings.USER_MAX_LENGTH,
     )
+    recipes_count = models.PositiveIntegerField(
+        'Кол-во рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Кол-во подписчиков',
+        default=0,
+        editable=False,
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = [
         'username',
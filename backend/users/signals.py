@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.signals import change_counter, is_deleting
+from users.models import Subscription, User
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, using, **kwargs):
+    if not (is_deleting(User, instance.author_id, using)
+            or is_deleting(User, instance.user_id, using)):
+        change_counter(User, instance.author_id, 'followers_count', -1)